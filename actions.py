@@ -1,39 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+from urllib.parse import urlencode
+import copy
+import gzip
 import json
-from logging import StreamHandler
-import re
+import random
+import time
 
-import requests
 import colorlog
+import requests
+
+from bodies import FileBody, GzipBody, MultipartBody
+from comparators import BaseComparator, format_diff
+from datasets import read_batches
+from decoders import get_decoder
+from logs import Truncated, setup_logger
+from reports import Records
+from sessions import Sessions, drain
+from streams import LimitedReader, BodyTooLarge, parse_stream
+from templates import Template, ValueTemplate
+from traces import get_tracer
 
-from comparators import BaseComparator
 
+RETRY_CODES = (429, 502, 503, 504)
+NO_BODY_METHODS = ('get', 'head', 'options')
 
 logger = colorlog.logging.getLogger(__name__)
-handler = StreamHandler()
-handler.setLevel('INFO')
-handler.setFormatter(colorlog.ColoredFormatter(
+log_writer = setup_logger(logger, colorlog.ColoredFormatter(
     '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 ))
-logger.addHandler(handler)
 logger.setLevel('INFO')
 
+default_sessions = None
+
+
+def get_default_sessions():
+    global default_sessions
+    if default_sessions is None:
+        default_sessions = Sessions()
+    return default_sessions
+
+
+def collect_references(actions):
+    references = {}
+    for action in actions:
+        for step in action.steps:
+            for variable in step.get_references():
+                path = variable.split('.')
+                target = action.get_step(path)
+                if target is not None:
+                    references.setdefault(id(target), set()).add(tuple(path[2:]))
+    return references
+
+
+def prune(data, paths):
+    # keeps only values which are used by variables of other steps
+    if () in paths:
+        return data
+    result = {}
+    for path in paths:
+        value = data
+        for level in path:
+            if not isinstance(value, dict) or level not in value:
+                break
+            value = value[level]
+        else:
+            target = result
+            for level in path[:-1]:
+                target = target.setdefault(level, {})
+            target[path[-1]] = value
+    return result
+
 
 class Step(object):
 
     def __init__(
         self, url, method='get', data={}, expected_code=200, expected_data=None,
-        comparator=BaseComparator(), skip_errors=False, name=None
+        comparator=BaseComparator(), skip_errors=False, name=None, stream=False,
+        max_size=None, cache=False, timeout=None, retries=0, backoff=0, json=None,
+        file=None, files=None, mmap=False, gzip=False, dataset=None
     ):
         self._parent = None
         self._url = url
+        self.url_template = Template(url)
         self.method = method.lower()
         self._data = data
+        self.data_templates = {}
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, str):
+                    self.data_templates[key] = Template(value)
+        self.json_template = ValueTemplate(json) if json is not None else None
+        self.file = file
+        self.files = files
+        self.mmap = mmap
+        self.gzip = gzip
         self.expected_code = expected_code
         self.expected_data = expected_data
         self.comparator = comparator
         self.skip_errors = skip_errors
         self._name = name
+        self.stream = stream
+        self.max_size = max_size
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.dataset = dataset
+        self.row = None
+        self.row_index = None
+        self.retried = 0
         self.results = {}
+        self.timings = {}
+        self.last_url = None
+        self.status_code = None
+        self.errors = []
+        self.passed = None
         super(Step, self).__init__()
 
     def __str__(self):
@@ -43,25 +125,208 @@ class Step(object):
         )
 
     def run(self):
-        logger_method = logger.info
-        if self.method == 'get':
-            resp = requests.get(self.url)
-        elif self.method == 'post':
-            resp = requests.post(self.url, data=self.data)
-        if not BaseComparator().compare(resp.status_code, self.expected_code):
-            if not self.skip_errors:
-                logger.error('status code %d not equal %d', resp.status_code, self.expected_code)
-            logger_method = logger.warning
-        if self.expected_data is not None:
+        tracer = get_tracer()
+        args = {'row': self.row_index} if self.dataset is not None else {}
+        with tracer.span(str(self.name), 'step', **args):
+            with tracer.span('resolve', 'resolve'):
+                url = self.url
+            schedulers = self.get_schedulers()
+            if not schedulers:
+                return self.send(url)
+            with ExitStack() as stack:
+                with tracer.span('schedule', 'schedule'):
+                    for scheduler in schedulers:
+                        stack.enter_context(scheduler.dispatch(url))
+                return self.send(url)
+
+    def expand(self):
+        if self.dataset is None:
+            yield self
+            return
+        # the same step is run once per row, rows are read in batches while it runs
+        index = 0
+        for rows in read_batches(self.dataset):
+            for row in rows:
+                self.row = row
+                self.row_index = index
+                index += 1
+                yield self
+        self.row = None
+
+    def send(self, url):
+        started = time.perf_counter()
+        self.retried = 0
+        while True:
+            attempted = time.perf_counter()
+            self.timings = {}
+            timeout = self.get_timeout()
+            if timeout is not None and timeout <= 0:
+                status_code, results, error = None, None, 'deadline of action is exceeded'
+                break
             try:
-                self.results = json.loads(resp.content.decode())
-            except ValueError:
-                self.results = None
-            if not self.comparator.compare(data=self.results, expect=self.expected_data):
-                if not self.skip_errors:
-                    logger.error('response data "%s" is not equal "%s"', self.results, self.expected_data)
-                logger_method = logger.warning
-        logger_method('%s %s %s', self.name, self.method.upper(), self.url)
+                status_code, results, error = self.fetch(url, timeout)
+            except requests.RequestException as e:
+                status_code, results, error = None, None, 'request failed: {}'.format(e)
+            delay = self.get_retry_delay(status_code)
+            if delay is None:
+                break
+            self.retried += 1
+            time.sleep(delay)
+        passed = self.check(status_code, url, results, error)
+        if self.retried:
+            self.timings['retry'] = attempted - started
+        self.timings['total'] = time.perf_counter() - started
+        return passed
+
+    def fetch(self, url, timeout=None):
+        tracer = get_tracer()
+        with tracer.span('resolve', 'resolve'):
+            kwargs = self.get_kwargs()
+        started = time.perf_counter()
+        if self.cache:
+            kwargs['cache'] = True
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        with tracer.span('network', 'network', url=url):
+            resp = self.get_sessions().request(self.method, url, stream=True, **kwargs)
+            self.timings['connect'] = getattr(resp, 'connect_time', 0)
+            self.timings['ttfb'] = time.perf_counter() - started
+            if self.is_transient(resp.status_code) and self.retried < self.retries:
+                resp.close()
+                return resp.status_code, None, None
+            results, error = None, None
+            if self.stream:
+                # stream is parsed while it is downloaded, so it is one span
+                try:
+                    results = parse_stream(LimitedReader(resp.raw, self.max_size), self.get_paths())
+                except BodyTooLarge as e:
+                    error = str(e)
+                finally:
+                    resp.close()
+                self.timings['download'] = time.perf_counter() - started - self.timings['ttfb']
+                return resp.status_code, results, error
+            if not self.needs_body():
+                drain(resp)
+                self.timings['download'] = time.perf_counter() - started - self.timings['ttfb']
+                return resp.status_code, None, None
+            content = resp.content
+            self.timings['download'] = time.perf_counter() - started - self.timings['ttfb']
+        decoding = time.perf_counter()
+        with tracer.span('decode', 'decode', size=len(content)):
+            results = self.decode(content)
+        self.timings['decode'] = time.perf_counter() - decoding
+        return resp.status_code, results, error
+
+    def is_transient(self, status_code):
+        # failed requests and gateway errors are retried unless they are expected
+        return status_code is None or (
+            status_code in RETRY_CODES and status_code != self.expected_code
+        )
+
+    def get_retry_delay(self, status_code):
+        # None if there is no attempt left or it would not end before deadline of action
+        if self.retried >= self.retries or not self.is_transient(status_code):
+            return None
+        # full jitter, so steps which failed at once are not retried at once
+        delay = random.uniform(0, self.backoff * 2 ** self.retried)
+        timeout = self.get_timeout()
+        if timeout is not None and timeout <= delay:
+            return None
+        return delay
+
+    def get_timeout(self):
+        expires = self._parent.get_expires() if self._parent else None
+        if expires is None:
+            return self.timeout
+        remaining = expires - time.perf_counter()
+        return remaining if self.timeout is None else min(self.timeout, remaining)
+
+    def needs_body(self):
+        # response is decoded only for comparison with result or for variables of other steps
+        return self.expected_data is not None or bool(self.get_referenced_paths())
+
+    def decode(self, content):
+        try:
+            return get_decoder()(content)
+        except ValueError:
+            return None
+
+    def get_paths(self):
+        paths = set(self.get_referenced_paths())
+        if isinstance(self.expected_data, dict):
+            paths.update((key,) for key in self.expected_data)
+        elif self.expected_data is not None:
+            paths.add(())
+        return paths
+
+    def get_kwargs(self):
+        if self.method in NO_BODY_METHODS:
+            return {}
+        headers = {}
+        if self.files:
+            body = MultipartBody(self.data, self.files, self.mmap)
+            headers['Content-Type'] = body.content_type
+        elif self.file:
+            body = FileBody(self.file, self.mmap)
+            headers['Content-Type'] = 'application/octet-stream'
+        elif self.json_template is not None:
+            if not self.gzip:
+                return {'json': self.json}
+            body = json.dumps(self.json).encode()
+            headers['Content-Type'] = 'application/json'
+        else:
+            if not self.gzip:
+                return {'data': self.data}
+            body = urlencode(self.data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.gzip:
+            # mtime is fixed, so the same body is compressed to the same bytes
+            body = gzip.compress(body, mtime=0) if isinstance(body, bytes) else GzipBody(body)
+            headers['Content-Encoding'] = 'gzip'
+        return {'data': body, 'headers': headers}
+
+    def check(self, status_code, url, results=None, error=None):
+        started = time.perf_counter()
+        errors = [] if error is None else [error]
+        with get_tracer().span('compare', 'compare'):
+            if not BaseComparator().compare(status_code, self.expected_code):
+                errors.append('status code {} not equal {}'.format(status_code, self.expected_code))
+            if self.expected_data is not None:
+                data = results
+                if self.stream and isinstance(results, dict) and isinstance(self.expected_data, dict):
+                    # stream results also have values for variables of other steps
+                    data = dict((key, results[key]) for key in self.expected_data if key in results)
+                diff = self.comparator.diff(data=data, expect=self.expected_data)
+                if diff:
+                    errors.append('response data does not match: {}'.format(format_diff(diff)))
+            self.results = prune(results, self.get_referenced_paths())
+        self.timings['compare'] = time.perf_counter() - started
+        if not self.skip_errors:
+            for message in errors:
+                logger.error('%s', Truncated(message))
+        logger_method = logger.warning if errors else logger.info
+        logger_method('%s %s %s', self.name, self.method.upper(), Truncated(url))
+        self.last_url = url
+        self.status_code = status_code
+        self.errors = errors
+        self.passed = not errors
+        return self.passed
+
+    def get_record(self):
+        record = {
+            'name': self.name,
+            'method': self.method.upper(),
+            'url': self.last_url,
+            'status_code': self.status_code,
+            'passed': self.passed,
+            'skip_errors': self.skip_errors,
+            'errors': self.errors,
+            'retries': self.retried,
+            'timings': self.timings,
+        }
+        if self.dataset is not None:
+            record['row'] = self.row_index
+        return record
 
     @property
     def name(self):
@@ -71,30 +336,58 @@ class Step(object):
 
     @property
     def url(self):
-        variables = re.compile('%(?P<variable>[\w\.]+)%').findall(self._url)
-        if variables:
-            url = self._url
-            for var in variables:
-                url = url.replace('%{}%'.format(var), self.get_variable(var))
-            return url
-        return self._url
+        return self.url_template.render(self.resolve)
+
+    @property
+    def json(self):
+        return self.json_template.render(self.resolve)
 
     @property
     def data(self):
         data = {}
         for key, value in self._data.items():
-            if isinstance(value, str):
-                variable = re.compile('%(?P<variable>[\w\.]+)%').match(value)
-                if variable:
-                    value = self.get_variable(variable.group('variable'))
-            data[key] = value
+            template = self.data_templates.get(key)
+            data[key] = template.render(self.resolve) if template else value
         return data
 
     def connect(self, parent):
         self._parent = parent
 
+    def copy(self):
+        step = copy.copy(self)
+        step._parent = None
+        step.results = {}
+        return step
+
+    def get_references(self):
+        references = list(self.url_template.variables)
+        for template in self.data_templates.values():
+            references.extend(template.variables)
+        if self.json_template is not None:
+            references.extend(self.json_template.variables)
+        return references
+
+    def get_referenced_paths(self):
+        if self._parent:
+            return self._parent.get_referenced_paths().get(id(self), set())
+        return set()
+
+    def resolve(self, path):
+        # columns of current row of dataset go before results of other steps
+        if self.row is not None and '.'.join(path) in self.row:
+            return self.row['.'.join(path)]
+        return self._parent.get_value(path) if self._parent else None
+
     def get_variable(self, variable):
-        return str(self._parent.get_variable(variable) if self._parent else None)
+        return str(self.resolve(variable.split('.')))
+
+    def get_sessions(self):
+        if self._parent:
+            return self._parent.get_sessions()
+        return get_default_sessions()
+
+    def get_schedulers(self):
+        return self._parent.get_schedulers() if self._parent else []
 
     def get_value(self, path):
         data = self.results
@@ -109,6 +402,12 @@ class Action(object):
         self._parent = None
         self.name = name
         self.steps = []
+        self._steps = {}
+        self.records = Records()
+        self.duration = 0
+        self.scheduler = None
+        self.deadline = None
+        self.expires = None
         for step in steps:
             self.add_step(step)
 
@@ -117,46 +416,278 @@ class Action(object):
 
     def add_step(self, step):
         self.steps.append(step)
+        self._steps.setdefault(step._name or '_', step)
         step.connect(self)
 
+    def start(self):
+        self.records = Records()
+        self.expires = time.perf_counter() + self.deadline if self.deadline else None
+
     def run(self):
-        for step in self.steps:
-            step.run()
+        started = time.perf_counter()
+        self.start()
+        with get_tracer().span(str(self.name), 'action'):
+            for step in self.steps:
+                for step in step.expand():
+                    if self.is_cancelled():
+                        break
+                    if not step.run() and not step.skip_errors:
+                        self.fail()
+                    # only failed rows of dataset are kept in report
+                    self.records.append(step.get_record(), keep=step.dataset is None)
+        self.duration = time.perf_counter() - started
 
     def connect(self, parent):
         self._parent = parent
 
-    def get_variable(self, variable):
-        path = variable.split('.')
+    def copy(self):
+        action = Action([step.copy() for step in self.steps], self.name)
+        action.scheduler = self.scheduler
+        action.deadline = self.deadline
+        return action
+
+    def get_sessions(self):
+        if self._parent:
+            return self._parent.get_sessions()
+        return get_default_sessions()
+
+    def is_cancelled(self):
+        return self._parent.cancelled if self._parent else False
+
+    def get_expires(self):
+        return self.expires
+
+    def fail(self):
+        if self._parent:
+            self._parent.fail()
+
+    def get_schedulers(self):
+        schedulers = self._parent.get_schedulers() if self._parent else []
+        return schedulers + [self.scheduler] if self.scheduler else schedulers
+
+    def get_dependencies(self):
+        dependencies = set()
+        for step in self.steps:
+            for variable in step.get_references():
+                name = variable.split('.')[0]
+                if name != self.name:
+                    dependencies.add(name)
+        return dependencies
+
+    def get_referenced_paths(self):
+        if self._parent:
+            return self._parent.get_referenced_paths()
+        return collect_references([self])
+
+    def get_step(self, path):
         if path[0] == self.name:
-            for step in self.steps:
-                if step.name == '.'.join(path[:2]):
-                    return step.get_value(path[2:])
-        else:
-            return self._parent.get_variable(variable) if self._parent else None
-        return None
+            return self._steps.get(path[1]) if len(path) > 1 else None
+        return self._parent.get_step(path) if self._parent else None
+
+    def get_value(self, path):
+        step = self.get_step(path)
+        return step.get_value(path[2:]) if step else None
+
+    def get_variable(self, variable):
+        return self.get_value(variable.split('.'))
 
 
 class Actions(object):
 
-    def __init__(self, actions=[]):
+    def __init__(self, actions=[], sessions=None, scheduler=None):
+        self.sessions = sessions if sessions is not None else Sessions()
+        self.scheduler = scheduler
         self.actions = []
+        self._actions = {}
+        self._references = None
+        self.duration = 0
+        self.fail_fast = False
+        self.cancelled = False
         for action in actions:
             self.add_action(action)
 
     def __str__(self):
         return '\n'.join(map(str, self.actions))
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # references are keyed by id of steps, which are new after unpickling
+        state['_references'] = None
+        return state
+
     def add_action(self, action):
         self.actions.append(action)
+        self._actions.setdefault(action.name, action)
+        self._references = None
         action.connect(self)
 
-    def run(self):
-        for action in self.actions:
-            action.run()
+    def run(self, warm=False, workers=1, durations=None, fail_fast=False):
+        started = time.perf_counter()
+        self.fail_fast = fail_fast
+        self.cancelled = False
+        if warm:
+            with get_tracer().span('warm', 'network'):
+                self.warm()
+        if workers > 1:
+            self.run_parallel(workers, durations)
+        else:
+            for action in self.actions:
+                if self.cancelled:
+                    break
+                action.run()
+        self.duration = time.perf_counter() - started
+        self.check_lag()
+
+    def run_parallel(self, workers, durations=None):
+        waiting = self.get_dependencies()
+        ranks = self.get_ranks(waiting, durations)
+        running, done = {}, set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while waiting or running:
+                if self.cancelled:
+                    waiting = {}
+                # actions are submitted only to free workers, so the longest ready one goes first
+                ready = sorted(
+                    (index for index, dependencies in waiting.items() if dependencies <= done),
+                    key=lambda index: (-ranks[index], index)
+                )
+                for index in ready[:workers - len(running)]:
+                    del waiting[index]
+                    running[executor.submit(self.actions[index].run)] = index
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future))
+                    future.result()
+
+    def get_dependencies(self):
+        # only earlier actions count, later ones are not run yet in serial mode either
+        first = {}
+        dependencies = {}
+        for index, action in enumerate(self.actions):
+            dependencies[index] = set(
+                first[name] for name in action.get_dependencies() if name in first
+            )
+            first.setdefault(action.name, index)
+        return dependencies
+
+    def get_ranks(self, dependencies, durations=None):
+        # estimated time from start of action to the end of the longest chain of actions which wait for it
+        durations = durations or {}
+        steps = sum(len(self.actions[index].steps) for index in durations)
+        per_step = sum(durations.values()) / steps if steps else 1
+        dependents = dict((index, []) for index in dependencies)
+        for index, items in dependencies.items():
+            for dependency in items:
+                dependents[dependency].append(index)
+        ranks = {}
+        for index in sorted(dependencies, reverse=True):
+            duration = durations.get(index, len(self.actions[index].steps) * per_step)
+            ranks[index] = duration + max([ranks[i] for i in dependents[index]] or [0])
+        return ranks
+
+    def fail(self):
+        if self.fail_fast and not self.cancelled:
+            self.cancelled = True
+            logger.warning('run is cancelled after the first failure')
+
+    def copy(self, sessions=None):
+        return Actions(
+            [action.copy() for action in self.actions],
+            sessions=sessions if sessions is not None else self.sessions,
+            scheduler=self.scheduler
+        )
+
+    def warm(self):
+        return self.sessions.warm(
+            step._url for action in self.actions for step in action.steps
+        )
+
+    def get_sessions(self):
+        return self.sessions
+
+    def get_schedulers(self):
+        return [self.scheduler] if self.scheduler else []
+
+    def check_lag(self):
+        schedulers = [('run', self.scheduler)]
+        schedulers.extend((action.name, action.scheduler) for action in self.actions)
+        for name, scheduler in schedulers:
+            if scheduler and scheduler.late:
+                stats = scheduler.get_stats()
+                logger.warning(
+                    '%s can not keep up with target rate: %d of %d steps late, max lag %.3fs',
+                    name, stats['late'], stats['steps'], stats['max_lag']
+                )
+
+    def get_referenced_paths(self):
+        if self._references is None:
+            self._references = collect_references(self.actions)
+        return self._references
+
+    def get_step(self, path):
+        action = self._actions.get(path[0])
+        return action.get_step(path) if action else None
+
+    def get_value(self, path):
+        step = self.get_step(path)
+        return step.get_value(path[2:]) if step else None
 
     def get_variable(self, variable):
-        path = variable.split('.')
-        for action in self.actions:
-            if action.name == path[0]:
-                return action.get_variable(variable)
+        return self.get_value(variable.split('.'))
+
+
+class LazyActions(Actions):
+
+    def __init__(self, source, references, sessions=None, scheduler=None):
+        super(LazyActions, self).__init__(sessions=sessions, scheduler=scheduler)
+        self.source = source
+        self.references = references
+        self.paths = {}
+
+    def run(self, warm=False, workers=1, durations=None, fail_fast=False):
+        started = time.perf_counter()
+        self.fail_fast = fail_fast
+        self.cancelled = False
+        action = None
+        for item in self.source():
+            if self.cancelled:
+                break
+            if isinstance(item, Action):
+                action = item
+                self.add_action(action)
+                action.start()
+                continue
+            if action is None:
+                action = Action()
+                self.add_action(action)
+                action.start()
+            self.run_step(action, item)
+        self.duration = time.perf_counter() - started
+        self.check_lag()
+
+    def run_step(self, action, step):
+        step.connect(action)
+        # only steps which are referenced later are kept in memory
+        key = (action.name, step._name or '_')
+        if key in self.references and key[1] not in action._steps:
+            action._steps[key[1]] = step
+            self.paths[id(step)] = self.references[key]
+        for step in step.expand():
+            if self.cancelled:
+                break
+            if not step.run() and not step.skip_errors:
+                self.fail()
+            action.records.append(step.get_record(), keep=False)
+            action.duration += step.timings.get('total', 0)
+
+    def copy(self, sessions=None):
+        return LazyActions(
+            self.source, self.references,
+            sessions=sessions if sessions is not None else self.sessions,
+            scheduler=self.scheduler
+        )
+
+    def get_referenced_paths(self):
+        return self.paths
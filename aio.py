@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+from actions import LazyActions
+from bodies import is_stream, iterate_async
+from sessions import DRAIN_SIZE
+from streams import AsyncLimitedReader, BodyTooLarge, parse_stream_async
+from traces import get_tracer
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+async def on_connection_create_start(session, context, params):
+    context.trace_request_ctx['connecting'] = time.perf_counter()
+
+
+async def on_connection_create_end(session, context, params):
+    timings = context.trace_request_ctx
+    timings['connect'] += time.perf_counter() - timings.pop('connecting')
+
+
+class AsyncRunner(object):
+
+    def __init__(self, actions, workers=100, durations=None, fail_fast=False):
+        if aiohttp is None:
+            raise ImportError('asyncio engine requires aiohttp')
+        if isinstance(actions, LazyActions):
+            raise ValueError('asyncio engine does not support lazy suites')
+        if actions.scheduler or any(action.scheduler for action in actions.actions):
+            raise ValueError('asyncio engine does not support rate limits')
+        self.actions = actions
+        self.workers = workers
+        self.durations = durations
+        self.fail_fast = fail_fast
+
+    async def run_step(self, session, step):
+        with get_tracer().span('resolve', 'resolve'):
+            url = step.url
+        started = time.perf_counter()
+        step.retried = 0
+        while True:
+            attempted = time.perf_counter()
+            step.timings = {'connect': 0}
+            timeout = step.get_timeout()
+            if timeout is not None and timeout <= 0:
+                status_code, results, error = None, None, 'deadline of action is exceeded'
+                break
+            try:
+                status_code, results, error = await self.fetch(session, step, url, timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status_code, results, error = None, None, 'request failed: {}'.format(
+                    str(e) or type(e).__name__
+                )
+            delay = step.get_retry_delay(status_code)
+            if delay is None:
+                break
+            step.retried += 1
+            await asyncio.sleep(delay)
+        passed = step.check(status_code, url, results, error)
+        if step.retried:
+            step.timings['retry'] = attempted - started
+        step.timings['total'] = time.perf_counter() - started
+        return passed
+
+    async def fetch(self, session, step, url, timeout=None):
+        tracer = get_tracer()
+        timings = step.timings
+        with tracer.span('resolve', 'resolve'):
+            kwargs = step.get_kwargs()
+        started = time.perf_counter()
+        if is_stream(kwargs.get('data')):
+            body = kwargs['data']
+            if hasattr(body, '__len__'):
+                kwargs['headers']['Content-Length'] = str(len(body))
+            kwargs['data'] = iterate_async(body)
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        results, error = None, None
+        with tracer.span('network', 'network', url=url):
+            async with session.request(
+                step.method, url, trace_request_ctx=timings, **kwargs
+            ) as resp:
+                timings['ttfb'] = time.perf_counter() - started
+                if step.is_transient(resp.status) and step.retried < step.retries:
+                    return resp.status, None, None
+                if step.stream:
+                    reader = AsyncLimitedReader(resp.content, step.max_size)
+                    try:
+                        results = await parse_stream_async(reader, step.get_paths())
+                    except BodyTooLarge as e:
+                        error = str(e)
+                    timings['download'] = time.perf_counter() - started - timings['ttfb']
+                    return resp.status, results, error
+                if not step.needs_body():
+                    # body is dropped while it is read, so connection is reused
+                    async for _ in resp.content.iter_chunked(DRAIN_SIZE):
+                        pass
+                    timings['download'] = time.perf_counter() - started - timings['ttfb']
+                    return resp.status, None, None
+                content = await resp.read()
+                timings['download'] = time.perf_counter() - started - timings['ttfb']
+        decoding = time.perf_counter()
+        with tracer.span('decode', 'decode', size=len(content)):
+            results = step.decode(content)
+        timings['decode'] = time.perf_counter() - decoding
+        return resp.status, results, error
+
+    async def run_action(self, session, semaphore, action, dependencies):
+        tracer = get_tracer()
+        # every action is own track of trace, tasks of one thread would overlap otherwise
+        tracer.set_track(id(action), str(action.name))
+        with tracer.span('queue', 'schedule'):
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            await semaphore.acquire()
+        try:
+            started = time.perf_counter()
+            action.start()
+            with tracer.span(str(action.name), 'action'):
+                for step in action.steps:
+                    for step in step.expand():
+                        if action.is_cancelled():
+                            break
+                        with tracer.span(str(step.name), 'step'):
+                            passed = await self.run_step(session, step)
+                        if not passed and not step.skip_errors:
+                            action.fail()
+                        action.records.append(step.get_record(), keep=step.dataset is None)
+            action.duration = time.perf_counter() - started
+        finally:
+            semaphore.release()
+
+    async def run_actions(self):
+        semaphore = asyncio.Semaphore(self.workers)
+        connector = aiohttp.TCPConnector(limit=self.workers, limit_per_host=0)
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        async with aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+            trace_configs=[trace_config]
+        ) as session:
+            tasks = {}
+            dependencies = self.actions.get_dependencies()
+            ranks = self.actions.get_ranks(dependencies, self.durations)
+            # semaphore is acquired in order of tasks, so the longest actions go first,
+            # dependencies always rank higher than actions which wait for them
+            for index in sorted(dependencies, key=lambda index: (-ranks[index], index)):
+                tasks[index] = asyncio.ensure_future(self.run_action(
+                    session, semaphore, self.actions.actions[index],
+                    [tasks[i] for i in dependencies[index]]
+                ))
+            await asyncio.gather(*tasks.values())
+
+    def run(self):
+        started = time.perf_counter()
+        self.actions.fail_fast = self.fail_fast
+        self.actions.cancelled = False
+        asyncio.run(self.run_actions())
+        self.actions.duration = time.perf_counter() - started
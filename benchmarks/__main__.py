@@ -0,0 +1,45 @@
+import argparse
+import json
+import platform
+import sys
+
+from benchmarks.cases import run_benchmarks, compare_results
+
+
+parser = argparse.ArgumentParser(description='Test-REST benchmarks')
+parser.add_argument('--output', '-o', type=str, default='benchmark.json', help='file of results, default = benchmark.json')
+parser.add_argument('--compare', '-c', type=str, metavar='BASELINE', help='compare results with results of an earlier run')
+parser.add_argument('--threshold', '-t', type=float, default=0.2, help='relative change which is a regression, default = 0.2')
+parser.add_argument('--latency', type=float, default=0, help='latency of stub server in seconds, default = 0')
+parser.add_argument('--size', type=int, default=0, help='payload size of stub server in bytes, default = 0')
+parser.add_argument('--steps', type=int, default=1000, help='number of steps run against stub server, default = 1000')
+parser.add_argument('--suite-steps', type=int, default=10000, help='number of steps of parsed suites, default = 10000')
+parser.add_argument('--count', type=int, default=100000, help='number of variable resolutions, default = 100000')
+parser.add_argument('--items', type=int, default=100000, help='number of items of compared dicts and lists, default = 100000')
+args = parser.parse_args()
+
+results = run_benchmarks(
+    latency=args.latency, size=args.size, steps=args.steps,
+    suite_steps=args.suite_steps, count=args.count, items=args.items,
+)
+with open(args.output, 'w') as fn:
+    json.dump({
+        'python': platform.python_version(),
+        'params': vars(args),
+        'results': results,
+    }, fn, indent=2)
+
+for name, result in sorted(results.items()):
+    print('{:<28} {:>14.3f} {}'.format(name, result['value'], result['unit']))
+
+if args.compare:
+    with open(args.compare) as fn:
+        baseline = json.load(fn)['results']
+    regressions = 0
+    print()
+    for name, previous, current, change, regression in compare_results(baseline, results, args.threshold):
+        regressions += regression
+        print('{:<28} {:>14.3f} {:>14.3f} {:>+8.1%}{}'.format(
+            name, previous, current, change, ' REGRESSION' if regression else ''
+        ))
+    sys.exit(1 if regressions else 0)
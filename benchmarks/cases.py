@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import time
+
+from actions import Step, Action, Actions, logger
+from comparators import DictComparator, ListComparator
+from loaders import YAMLLoader, JSONLLoader
+from sessions import Sessions
+
+from benchmarks.server import StubServer
+
+
+def metric(value, unit, better='lower'):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def measure(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count
+
+
+def bench_steps(url, expected, steps=1000):
+    # runner time per step which is not spent waiting for network
+    actions = Actions([
+        Action([Step(url, expected_data=expected) for _ in range(steps)], 'action'),
+    ], sessions=Sessions())
+    level = logger.level
+    logger.setLevel('WARNING')
+    try:
+        actions.run(warm=True)
+    finally:
+        logger.setLevel(level)
+    records = actions.actions[0].records
+    network = sum(
+        record['timings'].get(key, 0)
+        for record in records for key in ('connect', 'ttfb', 'download')
+    )
+    return {
+        'step.wall': metric(actions.duration / steps * 1e6, 'us/step'),
+        'step.overhead': metric((actions.duration - network) / steps * 1e6, 'us/step'),
+    }
+
+
+def get_suite(url, steps):
+    actions = []
+    for i in range(0, steps, 10):
+        actions.append({'action{}'.format(i): {'steps': [
+            {'step{}'.format(j): {
+                'url': 'items/%action{}.step{}.id%'.format(i, j - 1) if j else 'items',
+                'method': 'post' if j % 2 else 'get',
+                'data': {'value': j},
+                'result': {'rc': True, 'id': j},
+                'handler': 'dict(only_keys=True, level=1)',
+            }} for j in range(min(10, steps - i))
+        ]}})
+    return {'url': url, 'actions': actions}
+
+
+def bench_loaders(url, steps=10000):
+    suite = get_suite(url, steps)
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'suite.yaml')
+        with open(filename, 'w') as fn:
+            json.dump(suite, fn)  # json is yaml too and it is faster to write
+        started = time.perf_counter()
+        YAMLLoader(filename).load()
+        yaml_time = time.perf_counter() - started
+        filename = os.path.join(directory, 'suite.jsonl')
+        with open(filename, 'w') as fn:
+            fn.write(json.dumps({'root': {'url': url}}) + '\n')
+            for action in suite['actions']:
+                name, data = action.popitem()
+                fn.write(json.dumps({'action': name}) + '\n')
+                for step in data['steps']:
+                    step_name, step = step.popitem()
+                    step['step'] = step_name
+                    fn.write(json.dumps(step) + '\n')
+        started = time.perf_counter()
+        for _ in JSONLLoader(filename).load().source():
+            pass
+        jsonl_time = time.perf_counter() - started
+    finally:
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+        os.rmdir(directory)
+    return {
+        'loader.yaml': metric(yaml_time * 10000 / steps, 's/10k steps'),
+        'loader.jsonl': metric(jsonl_time * 10000 / steps, 's/10k steps'),
+    }
+
+
+def bench_variables(url, count=100000):
+    first = Step(url, name='step1')
+    first.results = {'id': 1, 'user': {'name': 'admin'}}
+    second = Step(
+        url + 'users/%action1.step1.user.name%/items/%action1.step1.id%',
+        method='post', data={'id': '%action1.step1.id%', 'text': 'hello'},
+    )
+    actions = Actions([Action([first], 'action1'), Action([second], 'action2')])
+    return {
+        'variables.url': metric(measure(lambda: second.url, count) * 1e6, 'us/render'),
+        'variables.data': metric(measure(lambda: second.data, count) * 1e6, 'us/render'),
+        'variables.lookup': metric(
+            measure(lambda: actions.get_variable('action1.step1.user.name'), count) * 1e6,
+            'us/lookup'
+        ),
+    }
+
+
+def bench_comparators(size=100000, count=5):
+    data = dict(('key{}'.format(i), {'id': i, 'tags': ['a', 'b']}) for i in range(size))
+    expect = dict((key, dict(value)) for key, value in data.items())
+    items = [{'id': i, 'name': 'item{}'.format(i)} for i in range(size)]
+    shuffled = items[1::2] + items[::2]
+    comparator = DictComparator()
+    keys = DictComparator(only_keys=True)
+    unordered = ListComparator(any_order=True)
+    result = {}
+    for name, compare, data, expect in (
+        ('dict', comparator.compare, data, expect),
+        ('dict_keys', keys.compare, data, expect),
+        ('list_any_order', unordered.compare, items, shuffled),
+    ):
+        elapsed = measure(lambda: compare(data, expect), count)
+        result['comparator.{}'.format(name)] = metric(size / elapsed, 'items/s', 'higher')
+    return result
+
+
+def run_benchmarks(latency=0, size=0, steps=1000, suite_steps=10000, count=100000, items=100000):
+    results = {}
+    with StubServer(latency=latency, size=size) as server:
+        results.update(bench_steps(server.url, json.loads(server.content.decode()), steps))
+    results.update(bench_loaders('http://127.0.0.1/', suite_steps))
+    results.update(bench_variables('http://127.0.0.1/', count))
+    results.update(bench_comparators(items))
+    return results
+
+
+def compare_results(baseline, results, threshold=0.2):
+    # relative change of each metric, positive change is always worse
+    changes = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous or not previous['value']:
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        if current['better'] == 'higher':
+            change = -change
+        changes.append((name, previous['value'], current['value'], change, change > threshold))
+    return changes
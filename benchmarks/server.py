@@ -0,0 +1,67 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import json
+import time
+
+
+def get_payload(size):
+    # json object of about size bytes
+    payload = {'rc': True, 'items': []}
+    while len(json.dumps(payload)) < size:
+        payload['items'].append({'id': len(payload['items']), 'name': 'item'})
+    return json.dumps(payload).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, nagle would delay keep-alive responses
+    disable_nagle_algorithm = True
+    latency = 0
+    content = get_payload(0)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # default backlog of 5 makes concurrent connects wait for SYN retransmits
+    request_queue_size = 1024
+
+
+class StubServer(object):
+
+    def __init__(self, latency=0, size=0):
+        self.content = get_payload(size)
+        handler = type('StubHandler', (StubHandler,), {
+            'latency': latency,
+            'content': self.content,
+        })
+        self.server = StubHTTPServer(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
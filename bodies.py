@@ -0,0 +1,107 @@
+from urllib.parse import quote
+import json
+import mmap
+import os
+import uuid
+import zlib
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FileBody(object):
+    # file is read in chunks while it is sent, so it is never loaded whole
+
+    def __init__(self, filename, use_mmap=False):
+        self.filename = filename
+        self.use_mmap = use_mmap
+
+    def __str__(self):
+        return 'file:{}'.format(self.filename)
+
+    def __len__(self):
+        return os.path.getsize(self.filename)
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as fn:
+            if self.use_mmap and len(self):
+                with mmap.mmap(fn.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for position in range(0, len(data), CHUNK_SIZE):
+                        yield data[position:position + CHUNK_SIZE]
+                return
+            while True:
+                chunk = fn.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class MultipartBody(object):
+
+    def __init__(self, fields, files, use_mmap=False, boundary=None):
+        self.fields = fields
+        self.files = files
+        self.boundary = boundary or uuid.uuid4().hex
+        self.parts = []
+        for name, value in fields.items():
+            self.parts.append(self.get_header(name) + '\r\n{}\r\n'.format(value).encode())
+        for name, filename in files.items():
+            self.parts.append(self.get_header(name, os.path.basename(filename)) + b'\r\n')
+            self.parts.append(FileBody(filename, use_mmap))
+            self.parts.append(b'\r\n')
+        self.parts.append('--{}--\r\n'.format(self.boundary).encode())
+
+    def __str__(self):
+        # boundary is random, so it is not a part of description
+        return 'multipart:{}'.format(json.dumps(
+            {'fields': self.fields, 'files': self.files}, sort_keys=True, default=str
+        ))
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from part
+
+    def get_header(self, name, filename=None):
+        header = '--{}\r\nContent-Disposition: form-data; name="{}"'.format(self.boundary, quote(name))
+        if filename is not None:
+            header += '; filename="{}"\r\nContent-Type: application/octet-stream'.format(quote(filename))
+        return (header + '\r\n').encode()
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+
+class GzipBody(object):
+    # size of compressed body is not known before it is sent, so it is chunked
+
+    def __init__(self, body):
+        self.body = body
+
+    def __str__(self):
+        return 'gzip:{}'.format(self.body)
+
+    def __iter__(self):
+        compressor = zlib.compressobj(wbits=31)
+        for chunk in self.body:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def is_stream(body):
+    return isinstance(body, (FileBody, MultipartBody, GzipBody))
+
+
+def iterate_async(body):
+    async def chunks():
+        for chunk in body:
+            yield bytes(chunk)
+    return chunks()
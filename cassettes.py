@@ -0,0 +1,90 @@
+from base64 import b64decode, b64encode
+from threading import Lock
+import json
+
+import requests
+
+from sessions import StoredResponse
+
+
+def get_body(kwargs):
+    body = dict((key, kwargs[key]) for key in ('data', 'json') if kwargs.get(key) is not None)
+    return json.dumps(body, sort_keys=True, default=str) if body else ''
+
+
+def get_key(method, url, body):
+    return method.upper(), url, body
+
+
+def encode_content(content):
+    try:
+        return {'content': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'content': b64encode(content).decode(), 'encoding': 'base64'}
+
+
+def decode_content(line):
+    if line.get('encoding') == 'base64':
+        return b64decode(line['content'])
+    return line['content'].encode('utf-8')
+
+
+class Recorder(object):
+
+    def __init__(self, sessions, fn):
+        self.sessions = sessions
+        self.fn = fn
+        self.lock = Lock()
+
+    def request(self, method, url, **kwargs):
+        resp = self.sessions.request(method, url, **kwargs)
+        content = resp.content
+        line = {
+            'method': method.upper(),
+            'url': url,
+            'body': get_body(kwargs),
+            'status_code': resp.status_code,
+            'headers': dict(resp.headers),
+        }
+        line.update(encode_content(content))
+        with self.lock:
+            self.fn.write(json.dumps(line) + '\n')
+            self.fn.flush()
+        return StoredResponse(
+            resp.status_code, resp.headers, content, getattr(resp, 'connect_time', 0)
+        )
+
+    def warm(self, urls):
+        return self.sessions.warm(urls)
+
+
+class Player(object):
+
+    def __init__(self, fn):
+        self.responses = {}
+        self.positions = {}
+        self.lock = Lock()
+        for line in fn:
+            line = line.strip()
+            if not line:
+                continue
+            line = json.loads(line)
+            key = get_key(line['method'], line['url'], line['body'])
+            self.responses.setdefault(key, []).append(
+                (line['status_code'], line['headers'], decode_content(line))
+            )
+
+    def request(self, method, url, **kwargs):
+        key = get_key(method, url, get_body(kwargs))
+        responses = self.responses.get(key)
+        if not responses:
+            # only this step fails, like on network error
+            raise requests.ConnectionError('no recorded response for {} {}'.format(method.upper(), url))
+        # same requests get responses in recorded order, the last one is repeated
+        with self.lock:
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+        return StoredResponse(*responses[min(position, len(responses) - 1)])
+
+    def warm(self, urls):
+        return []
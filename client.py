@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+from reports import get_reporter, get_summary, REPORTS
+
+
+# the same as daemon.DEFAULT_SOCKET, daemon is not imported to keep client start fast
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.cache', 'test-rest', 'daemon.sock')
+
+
+def submit(request, path=DEFAULT_SOCKET):
+    # yields messages of daemon while it runs test cases
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as fn:
+            for line in fn:
+                yield json.loads(line.decode())
+
+
+def write_report(report, args):
+    reporter = get_reporter(args.report)
+    if args.report_file:
+        with open(args.report_file, 'w') as fn:
+            reporter(report, fn)
+    else:
+        reporter(report, sys.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Test-REST client of daemon')
+    parser.add_argument('filename', type=str, nargs='?', help='test cases file')
+    parser.add_argument('--socket', '-s', type=str, default=DEFAULT_SOCKET, help='unix socket of daemon, default = ~/.cache/test-rest/daemon.sock')
+    parser.add_argument('--stop', action='store_true', help='stop daemon')
+    parser.add_argument('--format', '-f', type=str, help='file format, default = yaml')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='number of actions run in parallel, default = 1')
+    parser.add_argument('--fail-fast', action='store_true', help='cancel remaining steps after the first failure')
+    parser.add_argument('--quiet', '-q', action='store_true', help='print only failures and summary of run')
+    parser.add_argument('--report', '-r', type=str, choices=sorted(REPORTS), help='write report of run in the format')
+    parser.add_argument('--report-file', type=str, help='file of report, default = stdout')
+    args = parser.parse_args()
+
+    if args.stop:
+        request = {'command': 'stop'}
+    elif args.filename:
+        request = {
+            'command': 'run',
+            # daemon can run in other directory
+            'filename': os.path.abspath(args.filename),
+            'format': args.format,
+            'workers': args.workers,
+            'fail_fast': args.fail_fast,
+            'quiet': args.quiet,
+        }
+    else:
+        parser.error('the following arguments are required: filename')
+    report = None
+    try:
+        for message in submit(request, args.socket):
+            if 'log' in message:
+                print(message['log'], file=sys.stderr)
+            elif 'error' in message:
+                print(message['error'], file=sys.stderr)
+                sys.exit(2)
+            elif 'report' in message:
+                report = message['report']
+    except OSError as e:
+        print('daemon is not available on {}: {}'.format(args.socket, e), file=sys.stderr)
+        sys.exit(2)
+    if report is not None:
+        if args.quiet:
+            print(get_summary(report), file=sys.stderr)
+        if args.report:
+            write_report(report, args)
+        sys.exit(0 if report['passed'] else 1)
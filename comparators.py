@@ -1,8 +1,76 @@
+from collections import Counter
+
+
+DIFF_LIMIT = 10
+VALUE_LIMIT = 80
+
+
+class Missing(object):
+
+    def __repr__(self):
+        return '<missing>'
+
+
+MISSING = Missing()
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return frozenset([(key, freeze(item)) for key, item in value.items()])
+    if isinstance(value, list):
+        return tuple([freeze(item) for item in value])
+    return value
+
+
+def shorten(value, limit=VALUE_LIMIT):
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def format_diff(diff):
+    return '; '.join(
+        '{}: got {}, expected {}'.format(path, shorten(data), shorten(expect))
+        for path, data, expect in diff
+    )
+
+
+def get_diff(data, expect, limit=DIFF_LIMIT):
+    result = []
+    stack = [('$', data, expect)]
+    while stack and len(result) < limit:
+        path, data, expect = stack.pop()
+        if data == expect:
+            continue
+        if isinstance(data, dict) and isinstance(expect, dict):
+            for key in expect:
+                if key not in data:
+                    result.append(('{}.{}'.format(path, key), MISSING, expect[key]))
+            for key in data:
+                if key not in expect:
+                    result.append(('{}.{}'.format(path, key), data[key], MISSING))
+            for key in reversed(list(expect)):
+                if key in data:
+                    stack.append(('{}.{}'.format(path, key), data[key], expect[key]))
+        elif isinstance(data, list) and isinstance(expect, list):
+            if len(data) != len(expect):
+                result.append(('{}.length'.format(path), len(data), len(expect)))
+            for index in reversed(range(min(len(data), len(expect)))):
+                stack.append(('{}[{}]'.format(path, index), data[index], expect[index]))
+        else:
+            result.append((path, data, expect))
+    return result[:limit]
+
+
 class BaseComparator(object):
 
     def compare(self, data, expect):
         return data == expect
 
+    def diff(self, data, expect, limit=DIFF_LIMIT):
+        if self.compare(data, expect):
+            return []
+        return get_diff(data, expect, limit) or [('$', data, expect)]
+
 
 class DictComparator(BaseComparator):
 
@@ -10,25 +78,48 @@ class DictComparator(BaseComparator):
         self.only_keys = only_keys
         self.level = level
 
-    def __compare_keys(self, data, expect, level):
-        if level is None or level > 0:
-            result = data.keys() == expect.keys()
-            if not result:
-                return False
+    def __diff_keys(self, data, expect, limit):
+        result = []
+        stack = [('$', data, expect, self.level)]
+        while stack and len(result) < limit:
+            path, data, expect, level = stack.pop()
+            if level is not None and level <= 0:
+                continue
+            if not isinstance(data, dict):
+                result.append((path, data, expect))
+                continue
+            if data.keys() != expect.keys():
+                result.extend(
+                    ('{}.{}'.format(path, key), MISSING, expect[key])
+                    for key in expect if key not in data
+                )
+                result.extend(
+                    ('{}.{}'.format(path, key), data[key], MISSING)
+                    for key in data if key not in expect
+                )
+                continue
             for key, exp in expect.items():
                 if isinstance(exp, dict):
-                    value = data.get(key)
-                    if not isinstance(value, dict):
-                        return False
-                    if not self.__compare_keys(value, exp, level - 1 if level else None):
-                        return False
-        return True
+                    # value which is not dict differs even below the last compared level
+                    if not isinstance(data[key], dict):
+                        result.append(('{}.{}'.format(path, key), data[key], exp))
+                        continue
+                    stack.append((
+                        '{}.{}'.format(path, key), data[key], exp,
+                        level - 1 if level else None
+                    ))
+        return result[:limit]
 
     def compare(self, data, expect):
         if self.only_keys:
-            return self.__compare_keys(data, expect, self.level)
+            return not self.__diff_keys(data, expect, 1)
         return data == expect
 
+    def diff(self, data, expect, limit=DIFF_LIMIT):
+        if self.only_keys:
+            return self.__diff_keys(data, expect, limit)
+        return super(DictComparator, self).diff(data, expect, limit)
+
 
 class ListComparator(BaseComparator):
 
@@ -37,5 +128,28 @@ class ListComparator(BaseComparator):
 
     def compare(self, data, expect):
         if self.any_order:
-            return sorted(map(str, data)) == sorted(map(str, data))
+            if not isinstance(data, list) or len(data) != len(expect):
+                return False
+            return Counter(map(freeze, data)) == Counter(map(freeze, expect))
         return data == expect
+
+    def diff(self, data, expect, limit=DIFF_LIMIT):
+        if not self.any_order or not isinstance(data, list):
+            return super(ListComparator, self).diff(data, expect, limit)
+        data_keys, expect_keys = list(map(freeze, data)), list(map(freeze, expect))
+        data_counter, expect_counter = Counter(data_keys), Counter(expect_keys)
+        result = []
+        for keys, items, counter, is_expect in (
+            (expect_keys, expect, data_counter, True),
+            (data_keys, data, expect_counter, False),
+        ):
+            for index, key in enumerate(keys):
+                if len(result) >= limit:
+                    return result
+                if counter[key] > 0:
+                    counter[key] -= 1
+                elif is_expect:
+                    result.append(('$[{}]'.format(index), MISSING, items[index]))
+                else:
+                    result.append(('$[{}]'.format(index), items[index], MISSING))
+        return result
@@ -0,0 +1,141 @@
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from threading import Lock, Thread
+import argparse
+import json
+import logging
+import os
+import pickle
+
+from actions import LazyActions, log_writer, logger
+from loaders import get_loader
+from reports import get_report
+
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.cache', 'test-rest', 'daemon.sock')
+
+
+def get_stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Suite(object):
+    # parsed suite and open sessions which are kept between runs
+
+    def __init__(self, filename, loader):
+        self.filename = filename
+        self.loader = loader
+        self.stamp = None
+        self.content = None
+        self.sessions = None
+
+    def get_actions(self):
+        stamp = get_stamp(self.filename)
+        if stamp != self.stamp:
+            actions = self.loader(self.filename).load()
+            # every run gets own copy of suite with new results and schedulers
+            self.content = None if isinstance(actions, LazyActions) else pickle.dumps(actions)
+            if self.sessions is not None:
+                self.sessions.close()
+            self.sessions = actions.sessions
+            self.stamp = stamp
+        if self.content is None:
+            actions = self.loader(self.filename).load()
+        else:
+            actions = pickle.loads(self.content)
+        # responses are not cached between runs, connections are
+        self.sessions.cache = actions.sessions.cache
+        actions.sessions = self.sessions
+        return actions
+
+
+class ClientHandler(logging.Handler):
+
+    def __init__(self, send, level):
+        self.send = send
+        super(ClientHandler, self).__init__(level)
+        self.setFormatter(log_writer.handler.formatter)
+
+    def emit(self, record):
+        try:
+            self.send({'log': self.format(record)})
+        except OSError:
+            # client is gone, the run is finished anyway
+            pass
+
+
+class Daemon(object):
+
+    def __init__(self):
+        self.suites = {}
+        self.lock = Lock()
+
+    def get_suite(self, filename, format=None):
+        loader = get_loader(format or filename.split('.')[-1])
+        if not loader:
+            raise ValueError('format is not defined')
+        key = (filename, loader)
+        if key not in self.suites:
+            self.suites[key] = Suite(filename, loader)
+        return self.suites[key]
+
+    def run(self, request, send):
+        # runs share the logger and sessions, so they are queued
+        with self.lock:
+            actions = self.get_suite(request['filename'], request.get('format')).get_actions()
+            handler = ClientHandler(send, 'WARNING' if request.get('quiet') else 'INFO')
+            logger.addHandler(handler)
+            try:
+                actions.run(
+                    workers=request.get('workers', 1), fail_fast=request.get('fail_fast', False)
+                )
+            finally:
+                logger.removeHandler(handler)
+            return get_report(actions)
+
+
+class RequestHandler(StreamRequestHandler):
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b'\n')
+        self.wfile.flush()
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode())
+        if request.get('command') == 'stop':
+            self.send({'stopped': True})
+            Thread(target=self.server.shutdown).start()
+            return
+        try:
+            self.send({'report': self.server.daemon.run(request, self.send)})
+        except Exception as e:
+            # bad suite must not stop the daemon
+            self.send({'error': '{}: {}'.format(type(e).__name__, e)})
+
+
+class Server(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.daemon = Daemon()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        super(Server, self).__init__(path, RequestHandler)
+
+    def server_close(self):
+        super(Server, self).server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Test-REST daemon')
+    parser.add_argument('--socket', '-s', type=str, default=DEFAULT_SOCKET, help='unix socket of daemon, default = ~/.cache/test-rest/daemon.sock')
+    args = parser.parse_args()
+    server = Server(args.socket)
+    logger.info('daemon is listening on %s', args.socket)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
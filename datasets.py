@@ -0,0 +1,42 @@
+from itertools import islice
+import csv
+import json
+import os
+
+
+BATCH_SIZE = 1000
+
+
+def read_csv(filename):
+    with open(filename, newline='') as fn:
+        yield from csv.DictReader(fn)
+
+
+def read_jsonl(filename):
+    with open(filename) as fn:
+        for line in fn:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def read_rows(filename):
+    reader = READERS.get(os.path.splitext(filename)[1][1:].lower())
+    if reader is None:
+        raise ValueError('dataset "{}" is not csv or jsonl'.format(filename))
+    return reader(filename)
+
+
+def read_batches(filename, size=BATCH_SIZE):
+    rows = read_rows(filename)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,42 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def decode_json(content):
+    # json makes str of bytes before it parses them, orjson parses bytes without the copy
+    return json.loads(content)
+
+
+def decode_orjson(content):
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError as e:
+        # only these literals and numbers out of double range are accepted by json,
+        # other bodies are not parsed twice
+        if b'NaN' in content or b'Infinity' in content or 'infinity' in str(e):
+            return json.loads(content)
+        raise
+
+
+DECODERS = {'json': decode_json}
+if orjson is not None:
+    DECODERS['orjson'] = decode_orjson
+
+# orjson reads integers out of 64-bit range as floats, so it is used only if it is chosen
+decoder = decode_json
+
+
+def get_decoder():
+    return decoder
+
+
+def set_decoder(name):
+    global decoder
+    if name not in DECODERS:
+        raise ValueError('json decoder "{}" is not installed'.format(name))
+    decoder = DECODERS[name]
+    return decoder
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+
+
+DEFAULT_FILENAME = os.path.join(os.path.expanduser('~'), '.cache', 'test-rest', 'history.json')
+
+# weight of the last run in estimated duration of action
+WEIGHT = 0.5
+
+
+class History(object):
+    # durations of actions from earlier runs, by absolute name of suite file
+
+    def __init__(self, filename=DEFAULT_FILENAME):
+        self.filename = filename
+        try:
+            with open(filename) as fn:
+                self.suites = json.load(fn)
+        except (OSError, ValueError):
+            self.suites = {}
+
+    def get_key(self, filename):
+        return os.path.abspath(filename)
+
+    def get_durations(self, filename, actions):
+        history = self.suites.get(self.get_key(filename), {})
+        return dict(
+            (index, history[action.name])
+            for index, action in enumerate(actions.actions)
+            if action.name in history
+        )
+
+    def update(self, filename, actions):
+        history = self.suites.setdefault(self.get_key(filename), {})
+        for action in actions.actions:
+            # cancelled actions did not run all steps, so their duration is not known
+            if action.name is None or len(action.records) != len(action.steps):
+                continue
+            if action.name in history:
+                history[action.name] = WEIGHT * action.duration + (1 - WEIGHT) * history[action.name]
+            else:
+                history[action.name] = action.duration
+
+    def save(self):
+        directory = os.path.dirname(self.filename) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, filename = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fn:
+            json.dump(self.suites, fn)
+        os.replace(filename, self.filename)
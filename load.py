@@ -0,0 +1,106 @@
+from threading import Thread, Lock
+import re
+import time
+
+import requests
+
+from actions import LazyActions
+from sessions import Sessions
+from stats import Histogram
+
+
+UNITS = {
+    '': 1,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+}
+
+
+def parse_duration(text):
+    exp = re.match(r'^(?P<value>\d+(?:\.\d+)?)(?P<unit>[smh]?)$', str(text).strip())
+    if not exp:
+        raise ValueError('wrong duration "{}"'.format(text))
+    return float(exp.group('value')) * UNITS[exp.group('unit')]
+
+
+def get_label(step):
+    return step.name or '{} {}'.format(step.method.upper(), step._url)
+
+
+class StepStats(object):
+
+    def __init__(self, label):
+        self.label = label
+        self.errors = 0
+        self.histogram = Histogram()
+
+    def record(self, elapsed, passed):
+        self.histogram.record(elapsed)
+        if not passed:
+            self.errors += 1
+
+
+class LoadRunner(object):
+
+    def __init__(self, actions, users=10, duration=60):
+        if isinstance(actions, LazyActions):
+            raise ValueError('load mode does not support lazy suites')
+        self.actions = actions
+        self.users = users
+        self.duration = duration
+        self.stats = []
+        for action in actions.actions:
+            self.stats.append([StepStats(get_label(step)) for step in action.steps])
+        self.lock = Lock()
+        self.elapsed = 0
+        sessions = actions.sessions
+        if isinstance(sessions, Sessions) and sessions.pool_maxsize < users:
+            sessions = Sessions(
+                pool_size=sessions.pool_size, pool_maxsize=users, cache=sessions.cache
+            )
+        self.sessions = sessions
+
+    def record(self, i, j, elapsed, passed):
+        with self.lock:
+            self.stats[i][j].record(elapsed, passed)
+
+    def run_user(self, deadline):
+        while time.time() < deadline:
+            actions = self.actions.copy(sessions=self.sessions)
+            for i, action in enumerate(actions.actions):
+                for j, step in enumerate(action.steps):
+                    for step in step.expand():
+                        if time.time() >= deadline:
+                            return
+                        try:
+                            passed = step.run()
+                        except requests.RequestException:
+                            passed = False
+                        # total of step starts after rate limits, so pacing is not latency
+                        self.record(i, j, step.timings.get('total', 0), passed)
+
+    def run(self):
+        started = time.time()
+        deadline = started + self.duration
+        users = [Thread(target=self.run_user, args=(deadline,)) for _ in range(self.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        self.elapsed = time.time() - started
+        return self.stats
+
+    def report(self):
+        lines = ['{:<40} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+            'step', 'count', 'errors', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'
+        )]
+        for stats in (s for action in self.stats for s in action):
+            histogram = stats.histogram
+            lines.append('{:<40} {:>8} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+                stats.label[:40], histogram.count, stats.errors,
+                histogram.count / self.elapsed if self.elapsed else 0,
+                histogram.percentile(50) * 1000, histogram.percentile(95) * 1000,
+                histogram.percentile(99) * 1000, histogram.get_max() * 1000,
+            ))
+        return '\n'.join(lines)
@@ -1,11 +1,20 @@
-from distutils.util import strtobool
 from urllib.parse import urljoin
+import hashlib
+import json
+import os
+import pickle
 import re
+import tempfile
 
 import yaml
 
 import comparators
-from actions import Step, Action, Actions
+from actions import Step, Action, Actions, LazyActions
+from load import parse_duration
+from scheduler import RateProfile, Scheduler
+from sessions import ResponseCache, Sessions
+from templates import VARIABLE
+from traces import get_tracer
 
 
 COMPARATORS = {
@@ -28,6 +37,22 @@ COMPARATORS = {
 }
 
 
+# bump it when compiled suites change, so old cache files are ignored
+VERSION = 6
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def strtobool(value):
+    # the same as distutils.util.strtobool, distutils is removed in python 3.12
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError('invalid truth value {!r}'.format(value))
+
+
 TYPES = {
     bool: lambda a: bool(strtobool(a)),
     int: lambda a: int(a) if a is not None else None,
@@ -39,12 +64,49 @@ def parse_value(value, type):
     return TYPES.get(type, lambda a: a)(value)
 
 
+class SuiteCache(object):
+
+    def __init__(self, directory=os.path.join(os.path.expanduser('~'), '.cache', 'test-rest')):
+        self.directory = directory
+
+    def get_filename(self, key):
+        return os.path.join(self.directory, '{}.pickle'.format(key))
+
+    def get(self, key):
+        try:
+            with open(self.get_filename(key), 'rb') as fn:
+                return pickle.load(fn)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def set(self, key, actions):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, filename = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fn:
+            pickle.dump(actions, fn, pickle.HIGHEST_PROTOCOL)
+        os.replace(filename, self.get_filename(key))
+
+
 class BaseLoader(object):
+    filename = None
 
-    def __init__(self, data):
-        self.data = data
+    def __init__(self, data=None, cache=None):
+        self._data = data
+        self.cache = cache
         self.actions = None
 
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.parse()
+        return self._data
+
+    def parse(self):
+        return {}
+
+    def get_key(self):
+        return None
+
     def get_comparator(self, text):
         exp = re.search('(?P<name>\w+)(?:\((?P<args>.+)\))?', text)
         name, args = exp.group('name'), exp.group('args')
@@ -60,7 +122,9 @@ class BaseLoader(object):
 
     def get_block(
         self, block, url='', method='get', data={}, code=200, result=None,
-        handler='base', skip_errors=False
+        handler='base', skip_errors=False, stream=False, max_size=None, cache=False,
+        timeout=None, retries=0, backoff=0, json=None, file=None, files=None, mmap=False,
+        gzip=False
     ):
         return {
             'url': urljoin(url, block.get('url', '')),
@@ -70,8 +134,47 @@ class BaseLoader(object):
             'result': block.get('result', result),
             'handler': block.get('handler', handler),
             'skip_errors': block.get('skip_errors', skip_errors),
+            'stream': block.get('stream', stream),
+            'max_size': block.get('max_size', max_size),
+            'cache': block.get('cache', cache),
+            'timeout': block.get('timeout', timeout),
+            'retries': block.get('retries', retries),
+            'backoff': block.get('backoff', backoff),
+            'json': block.get('json', json),
+            'file': block.get('file', file),
+            'files': block.get('files', files),
+            'mmap': block.get('mmap', mmap),
+            'gzip': block.get('gzip', gzip),
         }
 
+    def get_step(self, data, params, name=None):
+        step_params = self.get_block(data, **params)
+        step_params['handler'] = self.get_comparator(step_params['handler'])
+        return Step(
+            url=step_params.get('url'),
+            method=step_params.get('method'),
+            data=step_params.get('data'),
+            expected_code=step_params.get('code'),
+            expected_data=step_params.get('result'),
+            comparator=step_params.get('handler'),
+            skip_errors=step_params.get('skip_errors'),
+            name=name,
+            stream=step_params.get('stream'),
+            max_size=parse_value(step_params.get('max_size'), int),
+            cache=step_params.get('cache'),
+            timeout=self.get_duration(step_params.get('timeout')),
+            retries=parse_value(step_params.get('retries'), int),
+            backoff=self.get_duration(step_params.get('backoff')),
+            json=step_params.get('json'),
+            file=self.get_path(step_params.get('file')),
+            files=dict(
+                (key, self.get_path(value)) for key, value in step_params['files'].items()
+            ) if step_params.get('files') else None,
+            mmap=step_params.get('mmap'),
+            gzip=step_params.get('gzip'),
+            dataset=self.get_path(data.get('dataset')),
+        )
+
     def get_steps(self, steps, params):
         result = []
         for step in steps:
@@ -79,45 +182,157 @@ class BaseLoader(object):
                 name, data = None, step
             else:
                 name, data = step.popitem()
-            step_params = self.get_block(data, **params)
-            step_params['handler'] = self.get_comparator(step_params['handler'])
-            result.append(Step(
-                url=step_params.get('url'),
-                method=step_params.get('method'),
-                data=step_params.get('data'),
-                expected_code=step_params.get('code'),
-                expected_data=step_params.get('result'),
-                comparator=step_params.get('handler'),
-                skip_errors=step_params.get('skip_errors'),
-                name=name,
-            ))
+            result.append(self.get_step(data, params, name))
         return result
 
+    def get_sessions(self):
+        kwargs = {}
+        for key in ('pool_size', 'pool_maxsize'):
+            if key in self.data:
+                kwargs[key] = parse_value(self.data[key], int)
+        cache = {}
+        for key, type in (('cache_ttl', float), ('cache_size', int)):
+            if key in self.data:
+                cache[key[6:]] = parse_value(self.data[key], type)
+        return Sessions(cache=ResponseCache(**cache), **kwargs)
+
+    def get_path(self, path):
+        # files of steps are relative to file of test cases
+        if path is None or self.filename is None:
+            return path
+        return os.path.join(os.path.dirname(os.path.abspath(self.filename)), path)
+
+    def get_duration(self, value):
+        return parse_duration(value) if value is not None else None
+
+    def get_rate(self, rate):
+        if isinstance(rate, dict):
+            profile = RateProfile(
+                parse_value(rate.get('from', 0), float),
+                parse_value(rate.get('to'), float),
+                parse_duration(rate.get('duration', 0)),
+            )
+        else:
+            profile = RateProfile(parse_value(rate, float))
+        if profile.start < 0 or profile.end <= 0:
+            raise ValueError('wrong rate "{}"'.format(rate))
+        return profile
+
+    def get_scheduler(self, block):
+        kwargs = {}
+        if block.get('rate') is not None:
+            kwargs['rate'] = self.get_rate(block['rate'])
+        for key, type in (('host_rate', float), ('host_burst', int), ('host_concurrency', int)):
+            if block.get(key) is not None:
+                kwargs[key] = parse_value(block[key], type)
+        return Scheduler(**kwargs) if kwargs else None
+
     def get_actions(self, actions, params):
-        result = Actions()
+        result = Actions(sessions=self.get_sessions(), scheduler=self.get_scheduler(self.data))
         for action in actions:
             name, data = action.popitem()
             steps = self.get_steps(data.get('steps'), self.get_block(data, **params))
-            result.add_action(Action(steps, name))
+            action = Action(steps, name)
+            action.scheduler = self.get_scheduler(data)
+            action.deadline = self.get_duration(data.get('deadline'))
+            result.add_action(action)
         return result
 
     def load(self):
         if self.actions is None:
-            self.actions = self.get_actions(self.data['actions'], self.get_block(self.data))
+            tracer = get_tracer()
+            with tracer.span('load', 'loader', filename=self.filename):
+                key = self.get_key() if self.cache else None
+                if key:
+                    with tracer.span('cache', 'loader'):
+                        self.actions = self.cache.get(key)
+                if self.actions is None:
+                    with tracer.span('parse', 'loader'):
+                        data = self.data
+                    with tracer.span('build', 'loader'):
+                        self.actions = self.get_actions(data['actions'], self.get_block(data))
+                    if key:
+                        self.cache.set(key, self.actions)
         return self.actions
 
 
 class YAMLLoader(BaseLoader):
 
-    def __init__(self, filename):
-        fn = open(filename)
-        super(YAMLLoader, self).__init__(yaml.load(fn))
-        fn.close()
+    def __init__(self, filename, cache=None):
+        self.filename = filename
+        with open(filename, 'rb') as fn:
+            self.content = fn.read()
+        super(YAMLLoader, self).__init__(cache=cache)
+
+    def parse(self):
+        return yaml.load(self.content, Loader=YAML_LOADER)
+
+    def get_key(self):
+        key = hashlib.sha256(self.content)
+        # paths of files are resolved, so the same content in other directory is other suite
+        key.update('{}:{}:{}'.format(
+            type(self).__name__, VERSION, os.path.dirname(os.path.abspath(self.filename))
+        ).encode())
+        return key.hexdigest()
+
+
+class JSONLLoader(BaseLoader):
+
+    def __init__(self, filename, cache=None):
+        self.filename = filename
+        root = {}
+        for line in self.read():
+            if 'root' in line:
+                root = line['root']
+            break
+        # suite is built lazily while it runs, so it is never cached
+        super(JSONLLoader, self).__init__(root, cache=cache)
+
+    def read(self):
+        with open(self.filename) as fn:
+            for line in fn:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def get_references(self):
+        references = {}
+        with open(self.filename) as fn:
+            for line in fn:
+                for variable in VARIABLE.findall(line):
+                    path = variable.split('.')
+                    if len(path) > 1:
+                        references.setdefault(tuple(path[:2]), set()).add(tuple(path[2:]))
+        return references
+
+    def get_items(self):
+        root = self.get_block(self.data)
+        params = root
+        for line in self.read():
+            if 'root' in line:
+                continue
+            if 'action' in line:
+                params = self.get_block(line, **root)
+                action = Action(name=line['action'])
+                action.scheduler = self.get_scheduler(line)
+                action.deadline = self.get_duration(line.get('deadline'))
+                yield action
+            else:
+                yield self.get_step(line, params, line.get('step'))
+
+    def load(self):
+        if self.actions is None:
+            self.actions = LazyActions(
+                self.get_items, self.get_references(), sessions=self.get_sessions(),
+                scheduler=self.get_scheduler(self.data)
+            )
+        return self.actions
 
 
 LOADERS = {
     'yaml': YAMLLoader,
     'yml': YAMLLoader,
+    'jsonl': JSONLLoader,
 }
 
 
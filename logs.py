@@ -0,0 +1,109 @@
+from logging import StreamHandler
+from logging.handlers import QueueHandler
+from queue import Empty, Queue
+from threading import Thread
+import atexit
+import os
+
+from comparators import shorten
+
+
+BATCH_SIZE = 1000
+LOG_LIMIT = 1000
+
+STOP = object()
+
+
+class Truncated(object):
+    # value is converted to text only when record is written
+
+    def __init__(self, value, limit=LOG_LIMIT):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        return text if len(text) <= self.limit else text[:self.limit - 3] + '...'
+
+    def __repr__(self):
+        return shorten(self.value, self.limit)
+
+
+class LazyQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        # records are formatted by writer thread, not by threads which run steps
+        return record
+
+
+class BatchHandler(StreamHandler):
+
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            if record.levelno < self.level:
+                continue
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if lines:
+            self.stream.write(''.join(lines))
+            self.flush()
+
+
+class LogWriter(object):
+    # records are queued by any thread and written in batches by one thread
+
+    def __init__(self, handler, batch_size=BATCH_SIZE):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queue = Queue()
+        self.queue_handler = LazyQueueHandler(self.queue)
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            stop = STOP in records
+            self.handler.emit_batch([record for record in records if record is not STOP])
+            for _ in records:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def restart(self):
+        # forked process has no writer thread and queue can be locked by it
+        self.queue = self.queue_handler.queue = Queue()
+        self.start()
+
+    def flush(self):
+        if self.thread and self.thread.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        if self.thread and self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()
+
+
+def setup_logger(logger, formatter, level='INFO'):
+    handler = BatchHandler()
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    writer = LogWriter(handler)
+    logger.addHandler(writer.queue_handler)
+    writer.start()
+    atexit.register(writer.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=writer.restart)
+    return writer
@@ -1,14 +1,89 @@
 import argparse
+import json
+import sys
 
-from loaders import get_loader
+from decoders import DECODERS, set_decoder
+from loaders import get_loader, SuiteCache
+from reports import get_report, get_reporter, get_summary, merge_reports, REPORTS
 
 
 parser = argparse.ArgumentParser(description='Test-REST')
-parser.add_argument('filename', type=str, help='test cases file')
+parser.add_argument('filename', type=str, nargs='?', help='test cases file')
 parser.add_argument('--format', '-f', type=str, help='file format, default = yaml')
+parser.add_argument('--workers', '-w', type=int, default=1, help='number of actions run in parallel, default = 1')
+parser.add_argument('--engine', '-e', type=str, default='threads', choices=['threads', 'asyncio'], help='execution engine, default = threads')
+parser.add_argument('--processes', '-p', type=int, default=1, help='number of processes which actions are split across, default = 1')
+parser.add_argument('--shard', type=str, help='run only shard i of n, i.e. 1/4')
+parser.add_argument('--merge', type=str, nargs='+', metavar='REPORT', help='merge json reports of shards instead of run')
+parser.add_argument('--record', type=str, metavar='CASSETTE', help='write requests and responses to jsonl file')
+parser.add_argument('--replay', type=str, metavar='CASSETTE', help='serve responses from jsonl file instead of network')
+parser.add_argument('--load', action='store_true', help='replay test cases from many virtual users')
+parser.add_argument('--users', '-u', type=int, default=10, help='number of virtual users in load mode, default = 10')
+parser.add_argument('--duration', '-d', type=str, default='1m', help='duration of load mode, i.e. 30s, 5m, 1h, default = 1m')
+parser.add_argument('--cache-dir', type=str, help='directory of compiled test cases, default = ~/.cache/test-rest')
+parser.add_argument('--no-cache', action='store_true', help='do not use compiled test cases')
+parser.add_argument('--report', '-r', type=str, choices=sorted(REPORTS), help='write report of run in the format')
+parser.add_argument('--report-file', type=str, help='file of report, default = stdout')
+parser.add_argument('--fail-fast', action='store_true', help='cancel remaining steps after the first failure')
+parser.add_argument('--history', type=str, help='file of action durations, the longest actions are started first, default = ~/.cache/test-rest/history.json')
+parser.add_argument('--no-history', action='store_true', help='do not use durations of earlier runs')
+parser.add_argument('--state', type=str, help='file of step outcomes of the last runs, default = ~/.cache/test-rest/state/<hash of filename>.json')
+parser.add_argument('--rerun-failed', action='store_true', help='run only failed steps of the last run and steps they depend on')
+parser.add_argument('--only', type=str, metavar='ACTIONS', help='run only comma separated actions and steps they depend on')
+parser.add_argument('--quiet', '-q', action='store_true', help='print only failures and summary of run')
+parser.add_argument('--decoder', type=str, choices=sorted(DECODERS), help='json decoder of responses, default = json')
+parser.add_argument('--trace', type=str, metavar='FILE', help='write timeline of run in chrome trace format')
+parser.add_argument('--warm', action='store_true', help='open connections to every host before run')
 args = parser.parse_args()
 
 
+def write_report(report):
+    reporter = get_reporter(args.report)
+    if args.report_file:
+        with open(args.report_file, 'w') as fn:
+            reporter(report, fn)
+    else:
+        reporter(report, sys.stdout)
+
+
+cassette = None
+
+
+def finish(report):
+    if cassette:
+        cassette.close()
+    if args.quiet:
+        from actions import log_writer
+        log_writer.flush()
+        print(get_summary(report), file=sys.stderr)
+    if args.report:
+        write_report(report)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if args.quiet:
+    from actions import log_writer
+    log_writer.handler.setLevel('WARNING')
+if args.decoder:
+    set_decoder(args.decoder)
+
+if args.merge:
+    reports = []
+    for filename in args.merge:
+        with open(filename) as fn:
+            reports.append(json.load(fn))
+    finish(merge_reports(reports))
+
+if not args.filename:
+    parser.error('the following arguments are required: filename')
+if (args.record or args.replay) and (args.processes > 1 or args.engine == 'asyncio'):
+    parser.error('--record and --replay work with one process and threads engine only')
+if args.trace and (args.processes > 1 or args.load):
+    parser.error('--trace can not be used with --processes and --load')
+if (args.rerun_failed or args.only) and (args.processes > 1 or args.shard or args.load):
+    parser.error('--rerun-failed and --only can not be used with --processes, --shard and --load')
+if args.processes > 1 and (args.load or args.engine == 'asyncio' or args.warm or args.history):
+    parser.error('--load, --engine asyncio, --warm and --history can not be used with --processes')
 if args.format:
     loader = get_loader(args.format)
 else:
@@ -16,5 +91,97 @@ else:
 if not loader:
     raise ValueError('format is not defined')
 
-actions = loader(args.filename).load()
-actions.run()
+cache = None
+if not args.no_cache:
+    cache = SuiteCache(args.cache_dir) if args.cache_dir else SuiteCache()
+
+if args.processes > 1:
+    from shards import run_processes
+    try:
+        report = run_processes(
+            loader, args.filename, cache=cache, processes=args.processes, workers=args.workers,
+            fail_fast=args.fail_fast
+        )
+    except ValueError as e:
+        parser.error(str(e))
+else:
+    tracer = None
+    if args.trace:
+        from traces import start_tracing
+        tracer = start_tracing()
+    suite = loader(args.filename, cache=cache)
+    actions = suite.load()
+    state, keys = None, None
+    if not args.shard and not args.load:
+        from state import RunState, get_state_filename
+        state = RunState(args.state or get_state_filename(args.filename), suite.get_key())
+    if args.rerun_failed or args.only:
+        from state import get_action_steps, get_closure, select_steps
+        if args.rerun_failed and not state.matches:
+            parser.error('suite is changed or was not run, there is no state to rerun')
+        try:
+            if args.rerun_failed:
+                keys = state.get_failed(actions)
+            else:
+                keys = get_action_steps(actions, [name.strip() for name in args.only.split(',')])
+            keys = get_closure(actions, keys)
+            actions = select_steps(actions, keys)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.shard:
+        from shards import get_shard, parse_shard
+        try:
+            actions = get_shard(actions, *parse_shard(args.shard))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.record:
+        from cassettes import Recorder
+        cassette = open(args.record, 'w')
+        actions.sessions = Recorder(actions.sessions, cassette)
+    elif args.replay:
+        from cassettes import Player
+        with open(args.replay) as fn:
+            actions.sessions = Player(fn)
+    if args.load:
+        from actions import logger
+        from load import LoadRunner, parse_duration
+        logger.setLevel('WARNING')
+        try:
+            runner = LoadRunner(actions, users=args.users, duration=parse_duration(args.duration))
+        except ValueError as e:
+            parser.error(str(e))
+        runner.run()
+        if cassette:
+            cassette.close()
+        print(runner.report())
+        sys.exit(0)
+    history, durations = None, None
+    if not args.no_history:
+        from history import History
+        history = History(args.history) if args.history else History()
+        durations = history.get_durations(args.filename, actions)
+    if args.engine == 'asyncio':
+        from aio import AsyncRunner
+        try:
+            runner = AsyncRunner(
+                actions, workers=args.workers, durations=durations, fail_fast=args.fail_fast
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        runner.run()
+    else:
+        actions.run(
+            warm=args.warm, workers=args.workers, durations=durations, fail_fast=args.fail_fast
+        )
+    if history and keys is None:
+        history.update(args.filename, actions)
+        history.save()
+    if state:
+        state.update(actions, keys)
+        state.save()
+    if tracer:
+        with open(args.trace, 'w') as fn:
+            tracer.write(fn)
+    report = get_report(actions)
+
+finish(report)
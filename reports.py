@@ -0,0 +1,182 @@
+from xml.etree import ElementTree
+import json
+
+
+TIMINGS = ('connect', 'ttfb', 'download', 'decode', 'compare', 'retry', 'total')
+
+
+def sum_timings(items):
+    # records or reports of actions
+    timings = dict((key, 0) for key in TIMINGS)
+    for item in items:
+        for key, value in item['timings'].items():
+            timings[key] = timings.get(key, 0) + value
+    return timings
+
+
+def is_failure(record):
+    # errors of steps with skip_errors are only warnings
+    return not record['passed'] and not record['skip_errors']
+
+
+class Records(object):
+    # totals of all records of action, records which passed are dropped unless they are kept,
+    # so lazy suites and datasets of any size do not need much memory for report
+
+    def __init__(self):
+        self.items = []
+        self.count = 0
+        self.failures = 0
+        self.retries = 0
+        self.timings = dict((key, 0) for key in TIMINGS)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def append(self, record, keep=True):
+        self.count += 1
+        self.failures += is_failure(record)
+        self.retries += record.get('retries', 0)
+        for key, value in record['timings'].items():
+            self.timings[key] = self.timings.get(key, 0) + value
+        if keep or not record['passed']:
+            self.items.append(record)
+
+
+def get_action_report(name, records, duration):
+    return {
+        'name': name,
+        'passed': not records.failures,
+        'steps': records.count,
+        'failures': records.failures,
+        'retries': records.retries,
+        'duration': duration,
+        'timings': dict(records.timings),
+        'records': list(records),
+    }
+
+
+def get_report(actions):
+    reports = []
+    for action in actions.actions:
+        report = get_action_report(action.name, action.records, action.duration)
+        if action.scheduler:
+            report['lag'] = action.scheduler.get_stats()
+        reports.append(report)
+    report = {
+        'passed': all(report['passed'] for report in reports),
+        'steps': sum(report['steps'] for report in reports),
+        'failures': sum(report['failures'] for report in reports),
+        'retries': sum(report['retries'] for report in reports),
+        'duration': actions.duration,
+        'timings': sum_timings(reports),
+        'actions': reports,
+    }
+    if actions.scheduler:
+        report['lag'] = actions.scheduler.get_stats()
+    if actions.cancelled:
+        report['cancelled'] = True
+    return report
+
+
+def get_summary(report):
+    skipped = sum(
+        1 for action in report['actions'] for record in action['records']
+        if not record['passed'] and record['skip_errors']
+    )
+    text = '{} steps, {} failed, {} skipped errors, {} retries in {:.3f}s'.format(
+        report['steps'], report['failures'], skipped, report.get('retries', 0), report['duration']
+    )
+    if report.get('cancelled'):
+        text += ', cancelled after the first failure'
+    return text
+
+
+def merge_lags(lags):
+    steps = sum(lag['steps'] for lag in lags)
+    return {
+        'steps': steps,
+        'late': sum(lag['late'] for lag in lags),
+        'mean_lag': sum(lag['mean_lag'] * lag['steps'] for lag in lags) / steps if steps else 0,
+        'max_lag': max(lag['max_lag'] for lag in lags),
+    }
+
+
+def merge_reports(reports):
+    reports = list(reports)
+    timings = dict((key, 0) for key in TIMINGS)
+    for report in reports:
+        for key, value in report['timings'].items():
+            timings[key] = timings.get(key, 0) + value
+    result = {
+        'passed': all(report['passed'] for report in reports),
+        'steps': sum(report['steps'] for report in reports),
+        'failures': sum(report['failures'] for report in reports),
+        'retries': sum(report.get('retries', 0) for report in reports),
+        # shards run at the same time, so the run lasts as long as the slowest one
+        'duration': max([report['duration'] for report in reports] or [0]),
+        'timings': timings,
+        'actions': [action for report in reports for action in report['actions']],
+    }
+    lags = [report['lag'] for report in reports if 'lag' in report]
+    if lags:
+        result['lag'] = merge_lags(lags)
+    if any(report.get('cancelled') for report in reports):
+        result['cancelled'] = True
+    return result
+
+
+def write_json(report, fn):
+    json.dump(report, fn, indent=2)
+
+
+def write_junit(report, fn):
+    root = ElementTree.Element('testsuites', {
+        'name': 'test-rest',
+        'tests': str(report['steps']),
+        'failures': str(report['failures']),
+        'time': '{:.6f}'.format(report['duration']),
+    })
+    for action in report['actions']:
+        suite = ElementTree.SubElement(root, 'testsuite', {
+            'name': str(action['name']),
+            'tests': str(action['steps']),
+            'failures': str(action['failures']),
+            'time': '{:.6f}'.format(action['duration']),
+        })
+        for record in action['records']:
+            case = ElementTree.SubElement(suite, 'testcase', {
+                'classname': str(action['name']),
+                'name': '{} {} {}'.format(record['name'], record['method'], record['url']),
+                'time': '{:.6f}'.format(record['timings'].get('total', 0)),
+            })
+            if not record['passed']:
+                failure = ElementTree.SubElement(case, 'failure' if is_failure(record) else 'skipped', {
+                    'message': '; '.join(record['errors']),
+                })
+                failure.text = '\n'.join(record['errors'])
+            properties = ElementTree.SubElement(case, 'properties')
+            ElementTree.SubElement(properties, 'property', {
+                'name': 'retries', 'value': str(record.get('retries', 0)),
+            })
+            for key, value in sorted(record['timings'].items()):
+                ElementTree.SubElement(properties, 'property', {
+                    'name': key, 'value': '{:.6f}'.format(value),
+                })
+    fn.write(ElementTree.tostring(root, encoding='unicode'))
+
+
+REPORTS = {
+    'json': write_json,
+    'junit': write_junit,
+}
+
+
+def get_reporter(format):
+    return REPORTS.get(format)
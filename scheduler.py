@@ -0,0 +1,134 @@
+from threading import Lock, Semaphore
+from urllib.parse import urlsplit
+import math
+import time
+
+
+# steps dispatched later than this are counted as late
+LAG_TOLERANCE = 0.01
+
+
+class RateProfile(object):
+    # rate grows linearly from start to end during duration, then it is constant
+
+    def __init__(self, start, end=None, duration=0):
+        self.start = start
+        self.end = start if end is None else end
+        self.duration = duration
+
+    def get_offset(self, index):
+        # time from the beginning when step number index has to be dispatched
+        if self.duration > 0 and self.start != self.end:
+            a = (self.end - self.start) / self.duration / 2
+            ramped = self.start * self.duration + a * self.duration ** 2
+            if index <= ramped:
+                return (math.sqrt(self.start ** 2 + 4 * a * index) - self.start) / (2 * a)
+            return self.duration + (index - ramped) / self.end
+        return index / self.end
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Dispatch(object):
+
+    def __init__(self, scheduler, host):
+        self.scheduler = scheduler
+        self.host = host
+        self.semaphore = None
+
+    def __enter__(self):
+        self.semaphore = self.scheduler.acquire(self.host)
+        return self
+
+    def __exit__(self, *args):
+        if self.semaphore:
+            self.semaphore.release()
+
+
+class Scheduler(object):
+
+    def __init__(self, rate=None, host_rate=None, host_burst=1, host_concurrency=None):
+        self.rate = rate
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.host_concurrency = host_concurrency
+        self.lock = Lock()
+        self.buckets = {}
+        self.semaphores = {}
+        self.started = None
+        self.steps = 0
+        self.late = 0
+        self.total_lag = 0
+        self.max_lag = 0
+
+    def __getstate__(self):
+        return {
+            'rate': self.rate,
+            'host_rate': self.host_rate,
+            'host_burst': self.host_burst,
+            'host_concurrency': self.host_concurrency,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def dispatch(self, url):
+        return Dispatch(self, urlsplit(url).netloc)
+
+    def acquire(self, host):
+        with self.lock:
+            index = self.steps
+            self.steps += 1
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.host_rate and host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+            if self.host_concurrency and host not in self.semaphores:
+                self.semaphores[host] = Semaphore(self.host_concurrency)
+        if self.rate:
+            self.wait(self.started + self.rate.get_offset(index))
+        if self.host_rate:
+            self.buckets[host].acquire()
+        semaphore = self.semaphores.get(host)
+        if semaphore:
+            semaphore.acquire()
+        return semaphore
+
+    def wait(self, scheduled):
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        lag = max(time.monotonic() - scheduled, 0)
+        with self.lock:
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag > LAG_TOLERANCE:
+                self.late += 1
+
+    def get_stats(self):
+        return {
+            'steps': self.steps,
+            'late': self.late,
+            'mean_lag': self.total_lag / self.steps if self.steps else 0,
+            'max_lag': self.max_lag,
+        }
@@ -0,0 +1,236 @@
+from http.cookiejar import DefaultCookiePolicy
+from collections import OrderedDict
+from threading import Event, Lock, local
+from urllib.parse import urlsplit
+import io
+import time
+
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+timer = local()
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_SIZE = 1000
+DRAIN_SIZE = 64 * 1024
+
+
+def get_base_url(url):
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc or '%' in parts.netloc:
+        return None
+    return '{}://{}/'.format(parts.scheme, parts.netloc)
+
+
+class Body(io.BytesIO):
+
+    def read(self, size=-1, decode_content=False):
+        return super(Body, self).read(size)
+
+
+class StoredResponse(object):
+    # response which is already read, i.e. from cassette or cache
+
+    def __init__(self, status_code, headers, content, connect_time=0):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.raw = Body(content)
+        self.connect_time = connect_time
+
+    def close(self):
+        pass
+
+
+def drain(resp):
+    # body is read to the end without decompression and dropped, so connection is reused
+    while resp.raw.read(DRAIN_SIZE, decode_content=False):
+        pass
+    resp.close()
+
+
+class TimedHTTPConnection(HTTPConnection):
+
+    def connect(self):
+        started = time.perf_counter()
+        super(TimedHTTPConnection, self).connect()
+        timer.connect = getattr(timer, 'connect', 0) + time.perf_counter() - started
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        started = time.perf_counter()
+        super(TimedHTTPSConnection, self).connect()
+        timer.connect = getattr(timer, 'connect', 0) + time.perf_counter() - started
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class CacheEntry(object):
+
+    def __init__(self, resp):
+        self.status_code = resp.status_code
+        self.headers = resp.headers
+        self.content = resp.content
+        self.stored = None
+
+    def get_response(self, connect_time=0):
+        return StoredResponse(self.status_code, self.headers, self.content, connect_time)
+
+    def get_validators(self):
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+
+class InFlight(object):
+
+    def __init__(self):
+        self.event = Event()
+        self.entry = None
+        self.error = None
+
+
+class ResponseCache(object):
+    # run-scoped cache of GET responses keyed by url
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, size=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.collapsed = 0
+
+    def __getstate__(self):
+        return {'ttl': self.ttl, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def request(self, sessions, url, **kwargs):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry and time.monotonic() - entry.stored < self.ttl:
+                self.entries.move_to_end(url)
+                self.hits += 1
+                return entry.get_response()
+            flight = self.in_flight.get(url)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[url] = InFlight()
+                self.misses += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            # the same request is running already, its response is shared
+            flight.event.wait()
+            if flight.error:
+                raise flight.error
+            return flight.entry.get_response()
+        try:
+            flight.entry, connect_time = self.fetch(sessions, url, entry, kwargs)
+            return flight.entry.get_response(connect_time)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[url]
+            flight.event.set()
+
+    def fetch(self, sessions, url, entry, kwargs):
+        validators = entry.get_validators() if entry else {}
+        if validators:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **validators)
+        resp = sessions.send('get', url, **kwargs)
+        revalidated = bool(validators) and resp.status_code == 304
+        if revalidated:
+            resp.close()
+        else:
+            entry = CacheEntry(resp)
+        with self.lock:
+            entry.stored = time.monotonic()
+            if revalidated:
+                self.revalidated += 1
+            if entry.status_code == 200:
+                self.entries[url] = entry
+                self.entries.move_to_end(url)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.pop(url, None)
+        return entry, getattr(resp, 'connect_time', 0)
+
+
+class Sessions(object):
+
+    def __init__(self, pool_size=DEFAULT_POOLSIZE, pool_maxsize=DEFAULT_POOLSIZE, cache=None):
+        self.pool_size = pool_size
+        self.pool_maxsize = pool_maxsize
+        self.cache = cache if cache is not None else ResponseCache()
+        self.session = requests.Session()
+        # steps must not leak cookies into each other
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __getstate__(self):
+        return {'pool_size': self.pool_size, 'pool_maxsize': self.pool_maxsize, 'cache': self.cache}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def request(self, method, url, cache=False, **kwargs):
+        if cache and method.lower() == 'get':
+            return self.cache.request(self, url, **kwargs)
+        return self.send(method, url, **kwargs)
+
+    def send(self, method, url, **kwargs):
+        timer.connect = 0
+        resp = self.session.request(method, url, **kwargs)
+        resp.connect_time = timer.connect
+        return resp
+
+    def warm(self, urls):
+        warmed = []
+        for url in urls:
+            base_url = get_base_url(url)
+            if base_url is None or base_url in warmed:
+                continue
+            warmed.append(base_url)
+            try:
+                self.request('head', base_url)
+            except requests.RequestException:
+                pass
+        return warmed
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,77 @@
+from multiprocessing import Pool
+import re
+
+from actions import Actions, LazyActions, log_writer
+from reports import get_report, merge_reports
+
+
+def parse_shard(text):
+    exp = re.match(r'^(?P<index>\d+)/(?P<count>\d+)$', str(text).strip())
+    if not exp or not 0 < int(exp.group('index')) <= int(exp.group('count')):
+        raise ValueError('wrong shard "{}", use i/n, i.e. 1/4'.format(text))
+    return int(exp.group('index')) - 1, int(exp.group('count'))
+
+
+def get_components(actions):
+    # actions which are linked by variables have to run in one process
+    parents = list(range(len(actions.actions)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for index, dependencies in actions.get_dependencies().items():
+        for dependency in dependencies:
+            parents[find(index)] = find(dependency)
+    components = {}
+    for index in range(len(parents)):
+        components.setdefault(find(index), []).append(index)
+    return list(components.values())
+
+
+def get_shards(actions, count):
+    if isinstance(actions, LazyActions):
+        raise ValueError('lazy suites can not be sharded')
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    components = [
+        (sum(len(actions.actions[index].steps) for index in component), component)
+        for component in get_components(actions)
+    ]
+    # the biggest components first, each one to the least loaded shard
+    for size, component in sorted(components, key=lambda item: (-item[0], item[1])):
+        index = loads.index(min(loads))
+        shards[index].extend(component)
+        loads[index] += size
+    return [sorted(shard) for shard in shards]
+
+
+def select(actions, indices):
+    return Actions(
+        [actions.actions[index].copy() for index in indices],
+        sessions=actions.sessions, scheduler=actions.scheduler
+    )
+
+
+def get_shard(actions, index, count):
+    return select(actions, get_shards(actions, count)[index])
+
+
+def run_shard(params):
+    loader, filename, cache, index, count, workers, fail_fast = params
+    actions = get_shard(loader(filename, cache=cache).load(), index, count)
+    actions.run(workers=workers, fail_fast=fail_fast)
+    # process of pool can be stopped before its logs are written
+    log_writer.flush()
+    return get_report(actions)
+
+
+def run_processes(loader, filename, cache=None, processes=2, workers=1, fail_fast=False):
+    params = [
+        (loader, filename, cache, index, processes, workers, fail_fast)
+        for index in range(processes)
+    ]
+    with Pool(processes) as pool:
+        return merge_reports(pool.map(run_shard, params))
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from actions import Action, Actions, LazyActions
+
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'test-rest', 'state')
+
+
+def get_state_filename(filename, directory=DEFAULT_DIRECTORY):
+    key = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(directory, '{}.json'.format(key[:32]))
+
+
+def get_action_steps(actions, names):
+    missing = set(names) - set(action.name for action in actions.actions)
+    if missing:
+        raise ValueError('unknown actions: {}'.format(', '.join(sorted(missing))))
+    return set(
+        (i, j)
+        for i, action in enumerate(actions.actions) if action.name in names
+        for j in range(len(action.steps))
+    )
+
+
+def get_closure(actions, keys):
+    # steps with the steps whose results their variables use, recursively
+    positions = dict(
+        (id(step), (i, j))
+        for i, action in enumerate(actions.actions)
+        for j, step in enumerate(action.steps)
+    )
+    result = set(keys)
+    stack = list(keys)
+    while stack:
+        i, j = stack.pop()
+        for variable in actions.actions[i].steps[j].get_references():
+            step = actions.get_step(variable.split('.'))
+            key = positions.get(id(step))
+            if key is not None and key not in result:
+                result.add(key)
+                stack.append(key)
+    return result
+
+
+def select_steps(actions, keys):
+    if isinstance(actions, LazyActions):
+        raise ValueError('steps of lazy suites can not be selected')
+    result = Actions(sessions=actions.sessions, scheduler=actions.scheduler)
+    for i, action in enumerate(actions.actions):
+        steps = [step.copy() for j, step in enumerate(action.steps) if (i, j) in keys]
+        if steps:
+            selected = Action(steps, action.name)
+            selected.scheduler = action.scheduler
+            selected.deadline = action.deadline
+            result.add_action(selected)
+    return result
+
+
+class RunState(object):
+    # outcome of every step of the last runs, by position of step in suite
+
+    def __init__(self, filename, key=None):
+        self.filename = filename
+        self.key = key
+        try:
+            with open(filename) as fn:
+                state = json.load(fn)
+        except (OSError, ValueError):
+            state = {}
+        self.matches = state.get('key') == key
+        self.steps = dict(
+            ((step['action'], step['step']), step) for step in state.get('steps', [])
+        ) if self.matches else {}
+
+    def get_failed(self, actions):
+        # failed steps and steps which were not run, i.e. after --fail-fast
+        return set(
+            (i, j)
+            for i, action in enumerate(actions.actions)
+            for j, step in enumerate(action.steps)
+            if (i, j) not in self.steps or not (
+                self.steps[(i, j)]['passed'] or self.steps[(i, j)]['skip_errors']
+            )
+        )
+
+    def update(self, actions, keys=None):
+        positions = sorted(keys) if keys is not None else [
+            (i, j) for i, action in enumerate(actions.actions) for j in range(len(action.steps))
+        ]
+        steps = [step for action in actions.actions for step in action.steps]
+        for key, step in zip(positions, steps):
+            if step.passed is None:
+                continue
+            self.steps[key] = {
+                'action': key[0],
+                'step': key[1],
+                'name': step.name,
+                'passed': step.passed,
+                'skip_errors': step.skip_errors,
+                'results': step.results,
+            }
+
+    def save(self):
+        directory = os.path.dirname(self.filename) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, filename = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fn:
+            json.dump({
+                'key': self.key,
+                'steps': [self.steps[key] for key in sorted(self.steps)],
+            }, fn)
+        os.replace(filename, self.filename)
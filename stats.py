@@ -0,0 +1,53 @@
+import math
+
+
+class Histogram(object):
+    # values are kept in log-linear buckets like HdrHistogram, 2 ** precision
+    # buckets per power of two give relative error below 1% with precision 7
+
+    def __init__(self, precision=7, unit=1e-6):
+        self.precision = precision
+        self.unit = unit
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        value = int(value / self.unit)
+        shift = max(value.bit_length() - self.precision, 0)
+        key = value >> shift << shift
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        rank = max(math.ceil(self.count * percent / 100), 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                # highest value equivalent to the bucket, like HdrHistogram
+                shift = max(key.bit_length() - self.precision, 0)
+                return min(key + (1 << shift) - 1, self.max) * self.unit
+        return self.max * self.unit
+
+    def get_max(self):
+        return self.max * self.unit
+
+    def get_mean(self):
+        return self.total / self.count * self.unit if self.count else 0
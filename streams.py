@@ -0,0 +1,117 @@
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class LimitedReader(object):
+
+    def __init__(self, raw, max_size=None):
+        self.raw = raw
+        self.max_size = max_size
+        self.size = 0
+
+    def count(self, chunk):
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise BodyTooLarge('response size exceeds {} bytes'.format(self.max_size))
+        return chunk
+
+    def read(self, size=-1):
+        return self.count(self.raw.read(size if size >= 0 else CHUNK_SIZE, decode_content=True))
+
+
+class AsyncLimitedReader(LimitedReader):
+
+    async def read(self, size=-1):
+        return self.count(await self.raw.read(size if size >= 0 else CHUNK_SIZE))
+
+
+# item of array, it is never a key of path, so paths do not go into arrays
+ITEM = object()
+
+
+class StreamParser(object):
+    # paths are tracked as tuples of keys, dotted prefixes of ijson would mix key "a.b" with a -> b
+
+    def __init__(self, paths):
+        self.paths = set(tuple(path) for path in paths)
+        self.keys = []
+        self.builders = {}
+        self.root = None
+
+    def get_path(self, event, value):
+        if event == 'map_key':
+            # key belongs to its map
+            self.keys[-1] = value
+            return tuple(self.keys[:-1])
+        if event in ('end_map', 'end_array'):
+            self.keys.pop()
+            return tuple(self.keys)
+        path = tuple(self.keys)
+        if event == 'start_map':
+            self.keys.append(None)
+        elif event == 'start_array':
+            self.keys.append(ITEM)
+        return path
+
+    def find(self, path):
+        for size in range(len(path) + 1):
+            if path[:size] in self.paths:
+                return path[:size]
+        return None
+
+    def feed(self, event, value):
+        if self.root is None:
+            self.root = event
+        wanted = self.find(self.get_path(event, value))
+        if wanted is None:
+            return
+        builder = self.builders.get(wanted)
+        if builder is None:
+            builder = self.builders[wanted] = ijson.ObjectBuilder()
+        builder.event(event, value)
+
+    def get_results(self):
+        if () in self.builders:
+            return self.builders[()].value
+        if self.root != 'start_map':
+            return None
+        results = {}
+        for path, builder in self.builders.items():
+            data = results
+            for level in path[:-1]:
+                data = data.setdefault(level, {})
+            data[path[-1]] = builder.value
+        return results
+
+
+def parse_stream(reader, paths):
+    if ijson is None:
+        raise ImportError('stream mode requires ijson')
+    parser = StreamParser(paths)
+    try:
+        for _, event, value in ijson.parse(reader, use_float=True):
+            parser.feed(event, value)
+    except ijson.JSONError:
+        return None
+    return parser.get_results()
+
+
+async def parse_stream_async(reader, paths):
+    if ijson is None:
+        raise ImportError('stream mode requires ijson')
+    parser = StreamParser(paths)
+    try:
+        async for _, event, value in ijson.parse_async(reader, use_float=True):
+            parser.feed(event, value)
+    except ijson.JSONError:
+        return None
+    return parser.get_results()
@@ -0,0 +1,66 @@
+import re
+
+
+VARIABLE = re.compile(r'%(?P<variable>[\w\.]+)%')
+
+
+class Template(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.segments = []
+        self.variables = []
+        position = 0
+        for match in VARIABLE.finditer(text):
+            if match.start() > position:
+                self.segments.append(text[position:match.start()])
+            variable = match.group('variable')
+            self.segments.append(tuple(variable.split('.')))
+            self.variables.append(variable)
+            position = match.end()
+        if position < len(text):
+            self.segments.append(text[position:])
+
+    def __str__(self):
+        return self.text
+
+    def render(self, resolve):
+        if not self.variables:
+            return self.text
+        return ''.join(
+            str(resolve(segment)) if isinstance(segment, tuple) else segment
+            for segment in self.segments
+        )
+
+
+class ValueTemplate(object):
+    # json value with templates in strings at any depth
+
+    def __init__(self, value):
+        self.variables = []
+        self.value = self.compile(value)
+
+    def compile(self, value):
+        if isinstance(value, dict):
+            return dict((key, self.compile(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [self.compile(item) for item in value]
+        if isinstance(value, str):
+            template = Template(value)
+            if template.variables:
+                self.variables.extend(template.variables)
+                return template
+        return value
+
+    def render(self, resolve, value=None):
+        value = self.value if value is None else value
+        if isinstance(value, Template):
+            if len(value.segments) == 1:
+                # the only variable keeps type of its value
+                return resolve(value.segments[0])
+            return value.render(resolve)
+        if isinstance(value, dict):
+            return dict((key, self.render(resolve, item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [self.render(resolve, item) for item in value]
+        return value
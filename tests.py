@@ -1,9 +1,45 @@
+from http.server import BaseHTTPRequestHandler
+import gzip
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from threading import Lock, Thread
+import time
 import unittest
 from unittest.mock import patch
+from xml.etree import ElementTree
+
+import requests
+import yaml
 
 import comparators
-from loaders import parse_value, BaseLoader, YAMLLoader, get_loader
-from actions import Step, Action, Actions
+from loaders import parse_value, BaseLoader, YAMLLoader, JSONLLoader, SuiteCache, get_loader
+from actions import Step, Action, Actions, LazyActions, prune
+from scheduler import RateProfile, Scheduler, TokenBucket
+from sessions import ResponseCache, Sessions, StoredResponse, get_base_url
+from aio import AsyncRunner
+from history import History
+from logs import BatchHandler, LazyQueueHandler, LogWriter, Truncated
+from load import LoadRunner, parse_duration
+from state import RunState, get_action_steps, get_closure, get_state_filename, select_steps
+from stats import Histogram
+from streams import LimitedReader, BodyTooLarge, parse_stream
+from templates import Template
+from traces import NullTracer, get_tracer, start_tracing, stop_tracing
+from reports import get_report, get_reporter, get_summary, merge_reports
+from bodies import FileBody, GzipBody
+from benchmarks.cases import bench_steps, compare_results
+from benchmarks.server import StubHTTPServer, StubServer
+from cassettes import Recorder, Player, encode_content
+from client import submit
+from daemon import Server
+from datasets import read_batches
+from decoders import DECODERS, decode_json, get_decoder, orjson, set_decoder
+from shards import get_components, get_shard, get_shards, parse_shard, run_processes
 
 
 class TestComparators(unittest.TestCase):
@@ -33,6 +69,74 @@ class TestComparators(unittest.TestCase):
         self.assertTrue(comp().compare([1, 2, 3], [1, 2, 3]))
         self.assertTrue(comp(True).compare([1, 2, 3], [1, 3, 2]))
         self.assertTrue(comp(True).compare([1, 2, 3], [2, 1, 3]))
+        self.assertFalse(comp(True).compare([1, 2, 3], [1, 2, 4]))
+        self.assertFalse(comp(True).compare([1, 1, 2], [1, 2, 2]))
+        self.assertFalse(comp(True).compare(None, [1]))
+        self.assertTrue(comp(True).compare([{'a': [1, 2]}, {'b': 1}], [{'b': 1}, {'a': [1, 2]}]))
+        self.assertFalse(comp(True).compare([{'a': [1, 2]}], [{'a': [2, 1]}]))
+
+    def test_list_large(self):
+        comp = comparators.ListComparator(True)
+        data = [{'id': i, 'tags': [i, str(i)]} for i in range(20000)]
+        expect = list(reversed(data))
+        self.assertTrue(comp.compare(data, expect))
+        expect[0] = {'id': -1, 'tags': []}
+        self.assertFalse(comp.compare(data, expect))
+        self.assertEqual(comp.diff(data, expect), [
+            ('$[0]', comparators.MISSING, {'id': -1, 'tags': []}),
+            ('$[19999]', {'id': 19999, 'tags': [19999, '19999']}, comparators.MISSING),
+        ])
+
+    def test_diff(self):
+        comp = comparators.BaseComparator()
+        self.assertEqual(comp.diff({'a': 1}, {'a': 1}), [])
+        self.assertEqual(comp.diff(
+            {'a': 1, 'b': {'c': [1, 2, 3]}, 'd': 1},
+            {'a': 2, 'b': {'c': [1, 5]}, 'e': 1},
+        ), [
+            ('$.e', comparators.MISSING, 1),
+            ('$.d', 1, comparators.MISSING),
+            ('$.a', 1, 2),
+            ('$.b.c.length', 3, 2),
+            ('$.b.c[1]', 2, 5),
+        ])
+        self.assertEqual(len(comp.diff(list(range(100)), list(range(1, 101)), limit=5)), 5)
+        self.assertEqual(
+            comparators.format_diff([('$.a', 'x' * 100, comparators.MISSING)]),
+            '$.a: got \'{}..., expected <missing>'.format('x' * 76)
+        )
+
+    def test_dict_diff(self):
+        comp = comparators.DictComparator(True)
+        self.assertEqual(comp.diff({'a': {'b': 1}}, {'a': {'c': 1}}), [
+            ('$.a.c', comparators.MISSING, 1),
+            ('$.a.b', 1, comparators.MISSING),
+        ])
+        self.assertEqual(comp.diff({'a': 1}, {'a': {'c': 1}}), [('$.a', 1, {'c': 1})])
+        self.assertEqual(comp.diff(None, {'a': 1}), [('$', None, {'a': 1})])
+        self.assertEqual(comp.diff({'a': 1}, {'a': 2}), [])
+
+    def test_dict_deep(self):
+        data, expect = {}, {}
+        current_data, current_expect = data, expect
+        for i in range(5000):
+            current_data['a'], current_expect['a'] = {}, {}
+            current_data, current_expect = current_data['a'], current_expect['a']
+        current_data['b'] = 1
+        current_expect['b'] = 2
+        self.assertTrue(comparators.DictComparator(True).compare(data, expect))
+        current_expect['c'] = 2
+        self.assertFalse(comparators.DictComparator(True).compare(data, expect))
+        self.assertTrue(comparators.DictComparator(True, 100).compare(data, expect))
+
+    def test_dict_keys_last_level(self):
+        comparator = comparators.DictComparator(only_keys=True, level=1)
+        self.assertFalse(comparator.compare({'a': 5}, {'a': {'b': 1}}))
+        self.assertEqual(comparator.diff({'a': 5}, {'a': {'b': 1}}), [('$.a', 5, {'b': 1})])
+        self.assertTrue(comparator.compare({'a': {'c': 1}}, {'a': {'b': 1}}))
+        comparator = comparators.DictComparator(only_keys=True, level=2)
+        self.assertFalse(comparator.compare({'a': {'b': 5}}, {'a': {'b': {'c': 1}}}))
+        self.assertTrue(comparator.compare({'a': {'b': {'d': 1}}}, {'a': {'b': {'c': 1}}}))
 
 
 class TestLoaders(unittest.TestCase):
@@ -106,6 +210,17 @@ class TestLoaders(unittest.TestCase):
             'result': None,
             'handler': 'base',
             'skip_errors': False,
+            'stream': False,
+            'max_size': None,
+            'cache': False,
+            'timeout': None,
+            'retries': 0,
+            'backoff': 0,
+            'json': None,
+            'file': None,
+            'files': None,
+            'mmap': False,
+            'gzip': False,
         }
         self.assertEqual(BaseLoader({}).get_block({}), expect)
         # inherited block 1
@@ -119,6 +234,17 @@ class TestLoaders(unittest.TestCase):
             'result': None,
             'handler': 'base',
             'skip_errors': False,
+            'stream': False,
+            'max_size': None,
+            'cache': False,
+            'timeout': None,
+            'retries': 0,
+            'backoff': 0,
+            'json': None,
+            'file': None,
+            'files': None,
+            'mmap': False,
+            'gzip': False,
         }
         self.assertEqual(BaseLoader({}).get_block(block, **params), expect)
         # inherited block 2
@@ -132,6 +258,17 @@ class TestLoaders(unittest.TestCase):
             'result': None,
             'handler': 'base',
             'skip_errors': False,
+            'stream': False,
+            'max_size': None,
+            'cache': False,
+            'timeout': None,
+            'retries': 0,
+            'backoff': 0,
+            'json': None,
+            'file': None,
+            'files': None,
+            'mmap': False,
+            'gzip': False,
         }
         self.assertEqual(BaseLoader({}).get_block(block, **params), expect)
 
@@ -159,6 +296,18 @@ class TestLoaders(unittest.TestCase):
             comparator='_comp',
             skip_errors=False,
             name=None,
+            stream=False,
+            max_size=None,
+            cache=False,
+            timeout=None,
+            retries=0,
+            backoff=0,
+            json=None,
+            file=None,
+            files=None,
+            mmap=False,
+            gzip=False,
+            dataset=None,
         )
 
     @patch('loaders.BaseLoader.get_comparator')
@@ -187,6 +336,18 @@ class TestLoaders(unittest.TestCase):
             comparator='_comp',
             skip_errors=False,
             name='step1',
+            stream=False,
+            max_size=None,
+            cache=False,
+            timeout=None,
+            retries=0,
+            backoff=0,
+            json=None,
+            file=None,
+            files=None,
+            mmap=False,
+            gzip=False,
+            dataset=None,
         )
 
     @patch('loaders.BaseLoader.get_steps')
@@ -234,8 +395,74 @@ class TestLoaders(unittest.TestCase):
     def test_get_loader(self):
         self.assertEqual(get_loader('yaml'), YAMLLoader)
         self.assertEqual(get_loader('yml'), YAMLLoader)
+        self.assertEqual(get_loader('jsonl'), JSONLLoader)
         self.assertIsNone(get_loader('xml'))
 
+    def write_jsonl(self, lines):
+        fd, filename = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as fn:
+            fn.write('\n'.join(map(json.dumps, lines)))
+        self.addCleanup(os.remove, filename)
+        return filename
+
+    def test_JSONLLoader(self):
+        filename = self.write_jsonl([
+            {'root': {'url': 'http://test.com/', 'code': 201, 'pool_size': 3}},
+            {'action': 'action1', 'url': '/api/', 'method': 'post'},
+            {'step': 'step1', 'url': 'auth', 'result': {'token': 'x'}, 'handler': 'dict(only_keys=1)'},
+            {'url': 'items?t=%action1.step1.token%', 'method': 'get'},
+            {'action': 'action2'},
+            {'step': 'step1', 'data': {'token': '%action1.step1.user.token%'}},
+        ])
+        loader = JSONLLoader(filename)
+        self.assertEqual(loader.data, {'url': 'http://test.com/', 'code': 201, 'pool_size': 3})
+        self.assertEqual(loader.get_references(), {
+            ('action1', 'step1'): {('token',), ('user', 'token')}
+        })
+        items = list(loader.get_items())
+        self.assertEqual(len(items), 5)
+        self.assertIsInstance(items[0], Action)
+        self.assertEqual(items[0].name, 'action1')
+        step = items[1]
+        self.assertEqual(step._name, 'step1')
+        self.assertEqual(step._url, 'http://test.com/api/auth')
+        self.assertEqual(step.method, 'post')
+        self.assertEqual(step.expected_code, 201)
+        self.assertTrue(step.comparator.only_keys)
+        self.assertEqual(items[2].method, 'get')
+        self.assertEqual(items[4]._url, 'http://test.com/')
+        self.assertEqual(items[4].method, 'get')
+        actions = loader.load()
+        self.assertIsInstance(actions, LazyActions)
+        self.assertEqual(actions.sessions.pool_size, 3)
+        self.assertIs(loader.load(), actions)
+
+    def test_JSONLLoader_run(self):
+        filename = self.write_jsonl([
+            {'url': 'http://test.com/'},
+            {'action': 'action1', 'url': 'http://test.com/'},
+            {'step': 'step1'},
+            {'step': 'step2'},
+            {'url': '%action1.step1.token%'},
+        ])
+        urls, kept = [], []
+
+        def run(step):
+            urls.append(step.url)
+            step.results = {'token': step._name}
+            kept.append(list(step._parent._steps))
+
+        actions = JSONLLoader(filename).load()
+        with patch('actions.Step.run', autospec=True, side_effect=run):
+            actions.run()
+        self.assertEqual(urls, ['http://test.com/'] * 3 + ['http://test.com/step1'])
+        self.assertEqual(kept, [[], ['step1'], ['step1'], ['step1']])
+        self.assertEqual([action.name for action in actions.actions], [None, 'action1'])
+        self.assertEqual([action.steps for action in actions.actions], [[], []])
+        self.assertEqual(actions.get_referenced_paths(), {
+            id(actions.get_step(['action1', 'step1'])): {('token',)}
+        })
+
 
 class TestActions(unittest.TestCase):
 
@@ -323,13 +550,9 @@ class TestActions(unittest.TestCase):
         Actions([action1, action2])
         self.assertEqual(step1.data, expect)
 
-    @patch('actions.requests.get')
+    @patch('sessions.Sessions.request')
     def test_Step_run_get(self, get):
-        class ResponseX():
-            status_code = 200
-            content = b'ok'
-
-        resp = ResponseX()
+        resp = StoredResponse(200, {}, b'ok')
         get.return_value = resp
         step = Step(url='http://test.com', method='get')
         # check only status code
@@ -345,7 +568,7 @@ class TestActions(unittest.TestCase):
         with self.assertLogs('actions') as cm:
             step.run()
             self.assertEqual(cm.output, [
-                'ERROR:actions:response data "None" is not equal "{\'test\': True}"',
+                'ERROR:actions:response data does not match: $: got None, expected {\'test\': True}',
                 'WARNING:actions:None GET http://test.com'
             ])
         # set wrong params and test
@@ -355,7 +578,7 @@ class TestActions(unittest.TestCase):
             step.run()
             self.assertEqual(cm.output, [
                 'ERROR:actions:status code 404 not equal 200',
-                'ERROR:actions:response data "{\'test\': False}" is not equal "{\'test\': True}"',
+                'ERROR:actions:response data does not match: $.test: got False, expected True',
                 'WARNING:actions:None GET http://test.com'
             ])
         # skip errors
@@ -363,17 +586,55 @@ class TestActions(unittest.TestCase):
         with self.assertLogs('actions', level='WARNING'):
             step.run()
 
-    @patch('actions.requests.post')
-    def test_Step_run_post(self, post):
+    def test_prune(self):
+        data = {'id': 1, 'user': {'token': 'x', 'name': 'y'}, 'items': [1, 2]}
+        self.assertEqual(prune(data, set()), {})
+        self.assertIs(prune(data, {(), ('id',)}), data)
+        self.assertEqual(prune(data, {('id',), ('user', 'token'), ('missing', 'key')}), {
+            'id': 1, 'user': {'token': 'x'}
+        })
+        self.assertEqual(prune(data, {('user', 'token'), ('user',)}), {
+            'user': {'token': 'x', 'name': 'y'}
+        })
+        self.assertEqual(prune(data, {('items', 'x')}), {})
+        self.assertEqual(prune(None, {('id',)}), {})
+
+    @patch('sessions.Sessions.request')
+    def test_Step_run_retention(self, request):
         class ResponseX():
             status_code = 200
-            content = b'ok'
+            content = b'{"token": "x", "user": {"id": 1, "name": "y"}, "items": [1, 2, 3]}'
 
-        resp = ResponseX()
+        request.return_value = ResponseX()
+        step1 = Step('http://test.com', expected_data={'token': 'x'}, name='step1')
+        step2 = Step('http://test.com', expected_data={'token': 'x'}, name='step2')
+        step3 = Step('http://test.com/%action1.step1.token%',
+                     data={'id': '%action1.step1.user.id%'})
+        Actions([Action([step1, step2], 'action1'), Action([step3], 'action2')])
+        with self.assertLogs('actions'):
+            step1.run()
+            step2.run()
+        self.assertEqual(step1.results, {'token': 'x', 'user': {'id': 1}})
+        self.assertEqual(step2.results, {})
+        self.assertEqual(step3.url, 'http://test.com/x')
+        self.assertEqual(step3.data, {'id': '1'})
+
+    @patch('sessions.Sessions.request')
+    def test_Step_run_post(self, post):
+        resp = StoredResponse(200, {}, b'ok')
         post.return_value = resp
         step = Step(url='http://test.com', method='post')
         with self.assertLogs('actions', level='INFO'):
             step.run()
+        post.assert_called_once_with('post', 'http://test.com', stream=True, data={})
+
+    def test_Step_get_sessions(self):
+        step = Step(url='http://test.com')
+        sessions = step.get_sessions()
+        self.assertIsInstance(sessions, Sessions)
+        self.assertIs(Step(url='/').get_sessions(), sessions)
+        actions = Actions([Action([step])])
+        self.assertIs(step.get_sessions(), actions.sessions)
 
     @patch('actions.Step.run')
     def test_Action_run(self, run):
@@ -386,3 +647,1540 @@ class TestActions(unittest.TestCase):
         actions = Actions([Action(), Action()])
         actions.run()
         self.assertEqual(run.call_count, 2)
+
+    def test_Template(self):
+        template = Template('http://test.com/%a.b.id%/x?t=%a.c.token%&id=%a.b.id%')
+        self.assertEqual(template.variables, ['a.b.id', 'a.c.token', 'a.b.id'])
+        self.assertEqual(template.segments, [
+            'http://test.com/', ('a', 'b', 'id'), '/x?t=', ('a', 'c', 'token'),
+            '&id=', ('a', 'b', 'id'),
+        ])
+        values = {('a', 'b', 'id'): 1, ('a', 'c', 'token'): 'abc'}
+        self.assertEqual(template.render(values.get), 'http://test.com/1/x?t=abc&id=1')
+        template = Template('http://test.com/')
+        self.assertEqual(template.segments, ['http://test.com/'])
+        self.assertEqual(template.render(None), 'http://test.com/')
+
+    def test_Actions_get_value(self):
+        step1 = Step('/', name='step1')
+        step1.results = {'id': 1}
+        step2 = Step('/', name='step1')
+        step2.results = {'id': 2}
+        step3 = Step('/')
+        step3.results = {'id': 3}
+        actions = Actions([
+            Action([step1, step2, step3], 'action1'),
+            Action([Step('/', name='step1')], 'action1'),
+        ])
+        # first step and action with the name win
+        self.assertEqual(actions.get_value(['action1', 'step1', 'id']), 1)
+        self.assertEqual(actions.get_value(['action1', '_', 'id']), 3)
+        self.assertIsNone(actions.get_value(['action1']))
+        self.assertIsNone(actions.get_value(['action1', 'step2', 'id']))
+        self.assertIsNone(actions.get_value(['action2', 'step1', 'id']))
+        self.assertIsNone(actions.actions[1].get_value(['action1', 'step1', 'id']))
+
+    def test_Step_get_references(self):
+        step = Step(
+            url='http://test.com/%action1.step1.id%?t=%action2.step1.token%',
+            data={'id': '%action3.step1.id%', 'control': True}
+        )
+        self.assertEqual(step.get_references(), [
+            'action1.step1.id', 'action2.step1.token', 'action3.step1.id'
+        ])
+
+    def test_Actions_get_dependencies(self):
+        actions = Actions([
+            Action([Step('http://test.com/%action3.step1.id%', name='step1')], 'action1'),
+            Action([Step('http://test.com/%action1.step1.id%', name='step1')], 'action2'),
+            Action([Step('http://test.com/%action3.step1.id%', name='step1')], 'action3'),
+            Action([Step('/', data={'a': '%action2.step1.a%', 'b': '%action1.step1.b%'})], 'action4'),
+        ])
+        self.assertEqual(actions.actions[3].get_dependencies(), {'action1', 'action2'})
+        self.assertEqual(actions.get_dependencies(), {0: set(), 1: {0}, 2: set(), 3: {0, 1}})
+
+    def test_Actions_run_parallel(self):
+        events = []
+
+        def run(step):
+            events.append(('start', step._url))
+            time.sleep(0.05 if step._url == 'slow' else 0.01)
+            events.append(('end', step._url))
+
+        actions = Actions([
+            Action([Step('slow', name='step1')], 'action1'),
+            Action([Step('fast')], 'action2'),
+            Action([Step('after', data={'id': '%action1.step1.id%'})], 'action3'),
+        ])
+        with patch('actions.Step.run', autospec=True, side_effect=run):
+            actions.run(workers=3)
+        self.assertEqual(len(events), 6)
+        self.assertLess(events.index(('start', 'fast')), events.index(('end', 'slow')))
+        self.assertLess(events.index(('end', 'slow')), events.index(('start', 'after')))
+
+    @patch('sessions.Sessions.request')
+    def test_Actions_warm(self, request):
+        actions = Actions([
+            Action([Step('http://test.com/a'), Step('http://test.com/b')]),
+            Action([Step('https://api.test.com/%main.step1.id%'), Step('%main.step1.url%')]),
+        ])
+        self.assertEqual(actions.warm(), ['http://test.com/', 'https://api.test.com/'])
+        self.assertEqual(request.call_count, 2)
+        request.assert_called_with('head', 'https://api.test.com/')
+
+
+class TestSessions(unittest.TestCase):
+
+    def test_get_base_url(self):
+        self.assertEqual(get_base_url('http://test.com/a/b?c=1'), 'http://test.com/')
+        self.assertEqual(get_base_url('https://test.com:8443'), 'https://test.com:8443/')
+        self.assertIsNone(get_base_url('/a/b'))
+        self.assertIsNone(get_base_url('http://%main.step1.host%/'))
+
+    def test_Sessions_pool(self):
+        sessions = Sessions(pool_size=3, pool_maxsize=20)
+        adapter = sessions.session.get_adapter('https://test.com/')
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertIs(sessions.session.get_adapter('http://test.com/'), adapter)
+
+    def test_BaseLoader_get_sessions(self):
+        sessions = BaseLoader({'pool_size': '4', 'pool_maxsize': 32}).get_sessions()
+        self.assertEqual(sessions.pool_size, 4)
+        self.assertEqual(sessions.pool_maxsize, 32)
+        sessions = BaseLoader({}).get_sessions()
+        self.assertEqual(sessions.pool_size, 10)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        content = json.dumps({'rc': True, 'path': self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerTestCase(unittest.TestCase):
+    handler = StubHandler
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubHTTPServer(('127.0.0.1', 0), cls.handler)
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def tearDown(self):
+        StubHandler.latency = 0
+
+
+class TestAsyncRunner(StubServerTestCase):
+
+    def test_run(self):
+        step1 = Step(self.url + 'token', expected_data={'rc': True, 'path': '/token'}, name='step1')
+        step2 = Step(self.url + '%action1.step1.path%/next', method='post', name='step2')
+        actions = Actions([Action([step1], 'action1'), Action([step2], 'action2')])
+        with self.assertLogs('actions') as cm:
+            AsyncRunner(actions, workers=2).run()
+        self.assertEqual(cm.output, [
+            'INFO:actions:action1.step1 GET {}token'.format(self.url),
+            'INFO:actions:action2.step2 POST {}/token/next'.format(self.url),
+        ])
+
+    def test_run_errors(self):
+        step = Step(self.url, expected_code=201, expected_data={'rc': False})
+        with self.assertLogs('actions') as cm:
+            AsyncRunner(Actions([Action([step])])).run()
+        self.assertEqual(cm.output, [
+            'ERROR:actions:status code 200 not equal 201',
+            'ERROR:actions:response data does not match: $.path: got \'/\', expected <missing>; $.rc: got True, expected False',
+            'WARNING:actions:None GET {}'.format(self.url),
+        ])
+
+    def test_run_stream(self):
+        step1 = Step(self.url, expected_data={'rc': True}, stream=True, max_size=1000, name='step1')
+        step2 = Step(self.url + '%action1.step1.path%', name='step2')
+        actions = Actions([Action([step1, step2], 'action1')])
+        with self.assertLogs('actions') as cm:
+            AsyncRunner(actions).run()
+        self.assertEqual(cm.output, [
+            'INFO:actions:action1.step1 GET {}'.format(self.url),
+            'INFO:actions:action1.step2 GET {}/'.format(self.url),
+        ])
+        self.assertEqual(step1.results, {'path': '/'})
+        step1.max_size = 10
+        with self.assertLogs('actions') as cm:
+            AsyncRunner(actions).run()
+        self.assertEqual(cm.output[0], 'ERROR:actions:response size exceeds 10 bytes')
+
+    def test_throughput(self):
+        StubHandler.latency = 0.05
+        actions = Actions([Action([Step(self.url + str(i))]) for i in range(100)])
+        started = time.time()
+        with self.assertLogs('actions') as cm:
+            AsyncRunner(actions, workers=100).run()
+        # serial run would take at least 5 seconds
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(len(cm.output), 100)
+
+
+class TestLoad(unittest.TestCase):
+
+    def test_Histogram(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.005)
+        self.assertAlmostEqual(histogram.percentile(95), 0.95, delta=0.01)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.01)
+        self.assertEqual(histogram.percentile(100), 1)
+        self.assertEqual(histogram.get_max(), 1)
+        self.assertAlmostEqual(histogram.get_mean(), 0.5005)
+        other = Histogram()
+        other.record(2)
+        histogram.merge(other)
+        self.assertEqual(histogram.count, 1001)
+        self.assertEqual(histogram.get_max(), 2)
+        self.assertEqual(Histogram().percentile(99), 0)
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration('30'), 30)
+        self.assertEqual(parse_duration('30s'), 30)
+        self.assertEqual(parse_duration('5m'), 300)
+        self.assertEqual(parse_duration('1.5h'), 5400)
+        with self.assertRaises(ValueError):
+            parse_duration('5 minutes')
+
+    def test_Actions_copy(self):
+        step = Step('http://test.com/%action1.step1.id%', name='step1')
+        step.results = {'id': 1}
+        actions = Actions([Action([step], 'action1')])
+        clone = actions.copy()
+        self.assertIs(clone.sessions, actions.sessions)
+        step_clone = clone.actions[0].steps[0]
+        self.assertIsNot(step_clone, step)
+        self.assertEqual(step_clone.name, 'action1.step1')
+        self.assertEqual(step_clone.url, 'http://test.com/None')
+        step_clone.results = {'id': 2}
+        self.assertEqual(step.url, 'http://test.com/1')
+        self.assertEqual(step_clone.url, 'http://test.com/2')
+
+    def test_LoadRunner(self):
+        users = []
+
+        def run(step):
+            users.append(step._parent._parent)
+            step.results = {'id': len(users)}
+            time.sleep(0.01)
+            step.timings = {'total': 0.01}
+            return step.url != 'http://test.com/fail'
+
+        actions = Actions([
+            Action([Step('http://test.com/', name='step1'), Step('http://test.com/fail')], 'action1'),
+        ])
+        runner = LoadRunner(actions, users=4, duration=0.2)
+        self.assertGreaterEqual(runner.sessions.pool_maxsize, 4)
+        with patch('actions.Step.run', autospec=True, side_effect=run):
+            stats = runner.run()
+        self.assertGreater(len(set(map(id, users))), 4)
+        self.assertNotIn(actions, users)
+        self.assertEqual(stats[0][0].label, 'action1.step1')
+        self.assertEqual(stats[0][1].label, 'action1._')
+        self.assertEqual(stats[0][0].errors, 0)
+        self.assertEqual(stats[0][1].errors, stats[0][1].histogram.count)
+        self.assertGreater(stats[0][0].histogram.count, 4)
+        report = runner.report().split('\n')
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report[1].startswith('action1.step1'))
+        self.assertAlmostEqual(stats[0][0].histogram.percentile(50), 0.01, delta=0.001)
+
+    def test_LoadRunner_rate(self):
+        with StubServer() as server:
+            actions = Actions(
+                [Action([Step(server.url, name='step1')], 'action1')],
+                scheduler=Scheduler(rate=RateProfile(20), host_concurrency=1)
+            )
+            actions.actions[0].connect(actions)
+            runner = LoadRunner(actions, users=2, duration=0.3)
+            with self.assertLogs('actions'):
+                stats = runner.run()
+        histogram = stats[0][0].histogram
+        self.assertGreater(histogram.count, 2)
+        # steps wait about 50ms for rate limit, it is not latency of requests
+        self.assertLess(histogram.percentile(50), 0.02)
+
+
+class RawX(io.BytesIO):
+
+    def read(self, size=-1, decode_content=False):
+        return super(RawX, self).read(size)
+
+
+class TestStreams(unittest.TestCase):
+
+    def parse(self, content, paths, max_size=None):
+        return parse_stream(LimitedReader(RawX(content), max_size), paths)
+
+    def test_parse_stream(self):
+        content = json.dumps({
+            'rc': True,
+            'items': [{'id': i} for i in range(1000)],
+            'user': {'id': 1, 'token': 'abc', 'profile': {'name': 'x'}},
+            'count': 1.5,
+        }).encode()
+        self.assertEqual(self.parse(content, set()), {})
+        self.assertEqual(self.parse(content, {('rc',), ('user', 'token')}), {
+            'rc': True, 'user': {'token': 'abc'}
+        })
+        self.assertEqual(self.parse(content, {('user',), ('user', 'token'), ('count',)}), {
+            'user': {'id': 1, 'token': 'abc', 'profile': {'name': 'x'}}, 'count': 1.5
+        })
+        self.assertEqual(self.parse(content, {(), ('rc',)}), json.loads(content.decode()))
+        self.assertIsNone(self.parse(b'[1, 2]', {('rc',)}))
+        self.assertEqual(self.parse(b'[1, 2]', {()}), [1, 2])
+        self.assertIsNone(self.parse(b'{"rc": tr', {('rc',)}))
+
+    def test_parse_stream_dotted_keys(self):
+        content = b'{"user": {"id": 1}, "user.id": 5, "a": [{"b": 2}], "a.b": {"c": 3}}'
+        self.assertEqual(self.parse(content, {('user', 'id')}), {'user': {'id': 1}})
+        self.assertEqual(self.parse(content, {('user',)}), {'user': {'id': 1}})
+        self.assertEqual(self.parse(content, {('user.id',)}), {'user.id': 5})
+        self.assertEqual(self.parse(content, {('a', 'b'), ('a.b', 'c')}), {'a.b': {'c': 3}})
+        self.assertEqual(self.parse(content, {('a',)}), {'a': [{'b': 2}]})
+
+    def test_parse_stream_max_size(self):
+        content = json.dumps({'items': list(range(100000))}).encode()
+        with self.assertRaises(BodyTooLarge):
+            self.parse(content, set(), max_size=1000)
+        self.assertEqual(self.parse(content, {('rc',)}, max_size=len(content)), {})
+
+    def test_Step_get_paths(self):
+        step1 = Step('/', expected_data={'rc': True, 'user': {'id': 1}}, name='step1')
+        step2 = Step('/%action1.step1.user.token%', data={'id': '%action1.step1.id%'})
+        step3 = Step('/', expected_data=[1, 2], name='step3')
+        actions = Actions([Action([step1, step3], 'action1'), Action([step2], 'action2')])
+        self.assertEqual(step1.get_paths(), {('rc',), ('user',), ('user', 'token'), ('id',)})
+        self.assertEqual(step2.get_paths(), set())
+        self.assertEqual(step3.get_paths(), {()})
+        self.assertEqual(actions.get_referenced_paths(), {
+            id(step1): {('user', 'token'), ('id',)}
+        })
+
+    @patch('sessions.Sessions.request')
+    def test_Step_run_stream(self, request):
+        class ResponseX():
+            status_code = 200
+            raw = None
+
+            def close(self):
+                pass
+
+        resp = ResponseX()
+        request.return_value = resp
+        step = Step(
+            url='http://test.com', expected_data={'rc': True}, stream=True, max_size=100,
+            name='step1'
+        )
+        resp.raw = RawX(b'{"rc": true, "items": [1, 2, 3], "id": 1}')
+        with self.assertLogs('actions') as cm:
+            self.assertTrue(step.run())
+        self.assertEqual(cm.output, ['INFO:actions:step1 GET http://test.com'])
+        self.assertEqual(step.results, {})
+        Action([step, Step('http://test.com/%action1.step1.id%')], 'action1')
+        resp.raw = RawX(b'{"rc": true, "items": [1, 2, 3], "id": 1}')
+        with self.assertLogs('actions'):
+            self.assertTrue(step.run())
+        self.assertEqual(step.results, {'id': 1})
+        request.assert_called_with('get', 'http://test.com', stream=True)
+        resp.raw = RawX(b'{"rc": true, "items": [' + b'1, ' * 100 + b'1]}')
+        with self.assertLogs('actions') as cm:
+            self.assertFalse(step.run())
+        self.assertEqual(cm.output, [
+            'ERROR:actions:response size exceeds 100 bytes',
+            'ERROR:actions:response data does not match: $: got None, expected {\'rc\': True}',
+            'WARNING:actions:action1.step1 GET http://test.com',
+        ])
+
+
+class TestSuiteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_YAMLLoader_cache(self):
+        cache = SuiteCache(self.directory)
+        loader = YAMLLoader('test.yaml', cache=cache)
+        key = loader.get_key()
+        self.assertEqual(key, YAMLLoader('test.yaml').get_key())
+        self.assertIsNone(cache.get(key))
+        actions = loader.load()
+        self.assertEqual(os.listdir(self.directory), ['{}.pickle'.format(key)])
+        with patch('loaders.YAMLLoader.parse') as parse:
+            cached = YAMLLoader('test.yaml', cache=cache).load()
+            self.assertFalse(parse.called)
+        self.assertIsNot(cached, actions)
+        self.assertEqual(str(cached), str(actions))
+        step = cached.actions[0].steps[0]
+        self.assertIsInstance(step.comparator, comparators.DictComparator)
+        self.assertIs(step.get_sessions(), cached.sessions)
+        self.assertEqual(cached.sessions.pool_maxsize, actions.sessions.pool_maxsize)
+
+    def test_get_key(self):
+        filename = os.path.join(self.directory, 'test.yaml')
+        with open(filename, 'w') as fn:
+            fn.write('actions: []')
+        key = YAMLLoader(filename).get_key()
+        with patch('loaders.VERSION', -1):
+            self.assertNotEqual(YAMLLoader(filename).get_key(), key)
+        with open(filename, 'a') as fn:
+            fn.write('\n')
+        self.assertNotEqual(YAMLLoader(filename).get_key(), key)
+        self.assertIsNone(BaseLoader({}).get_key())
+
+    def test_broken_cache(self):
+        cache = SuiteCache(self.directory)
+        with open(cache.get_filename('key'), 'wb') as fn:
+            fn.write(b'broken')
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', Actions([Action([Step('/', name='step1')], 'action1')]))
+        actions = cache.get('key')
+        step = actions.get_step(['action1', 'step1'])
+        step.results = {'id': 1}
+        self.assertEqual(actions.get_value(['action1', 'step1', 'id']), 1)
+
+
+class TestReports(StubServerTestCase):
+
+    def get_actions(self):
+        return Actions([
+            Action([
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}, name='step1'),
+                Step(self.url + 'b', expected_code=201, name='step2'),
+            ], 'action1'),
+            Action([Step(self.url + 'c', method='post', data={'x': 1})], 'action2'),
+        ])
+
+    def check_report(self, report):
+        self.assertFalse(report['passed'])
+        self.assertEqual(report['steps'], 3)
+        self.assertEqual(report['failures'], 1)
+        self.assertGreater(report['duration'], 0)
+        self.assertEqual(len(report['actions']), 2)
+        action = report['actions'][0]
+        self.assertEqual(action['name'], 'action1')
+        self.assertFalse(action['passed'])
+        self.assertEqual(action['failures'], 1)
+        self.assertEqual([record['passed'] for record in action['records']], [True, False])
+        self.assertEqual(action['records'][1]['errors'], ['status code 200 not equal 201'])
+        self.assertEqual(action['records'][0]['url'], self.url + 'a')
+        self.assertEqual(action['records'][0]['status_code'], 200)
+        self.assertTrue(report['actions'][1]['passed'])
+        timings = action['records'][0]['timings']
+        self.assertEqual(set(timings), {'connect', 'ttfb', 'download', 'decode', 'compare', 'total'})
+        self.assertGreater(timings['connect'], 0)
+        self.assertGreaterEqual(timings['total'], timings['ttfb'])
+        self.assertAlmostEqual(
+            report['timings']['total'],
+            sum(r['timings']['total'] for a in report['actions'] for r in a['records'])
+        )
+
+    def test_report(self):
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            actions.run()
+        self.check_report(get_report(actions))
+
+    def test_report_async(self):
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            AsyncRunner(actions).run()
+        self.check_report(get_report(actions))
+
+    def test_report_lazy(self):
+        items = [Action(name='action1')] + self.get_actions().actions[0].steps + [
+            Action(name='action2'), Step(self.url + 'c'),
+        ]
+        actions = LazyActions(lambda: iter(items), {})
+        with self.assertLogs('actions'):
+            actions.run()
+        report = get_report(actions)
+        self.assertEqual((report['steps'], report['failures']), (3, 1))
+        # steps of lazy suite which passed are only counted
+        self.assertEqual([len(action['records']) for action in report['actions']], [1, 0])
+        self.assertEqual(report['actions'][0]['records'][0]['errors'], ['status code 200 not equal 201'])
+        self.assertEqual(report['actions'][1]['steps'], 1)
+        self.assertGreater(report['actions'][1]['timings']['total'], 0)
+
+    def test_write(self):
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            actions.run()
+        report = get_report(actions)
+        fn = io.StringIO()
+        get_reporter('json')(report, fn)
+        self.assertEqual(json.loads(fn.getvalue()), report)
+        fn = io.StringIO()
+        get_reporter('junit')(report, fn)
+        root = ElementTree.fromstring(fn.getvalue())
+        self.assertEqual(root.tag, 'testsuites')
+        self.assertEqual(root.get('tests'), '3')
+        self.assertEqual(root.get('failures'), '1')
+        suites = root.findall('testsuite')
+        self.assertEqual([suite.get('name') for suite in suites], ['action1', 'action2'])
+        cases = suites[0].findall('testcase')
+        self.assertEqual(len(cases), 2)
+        self.assertIsNone(cases[0].find('failure'))
+        self.assertEqual(cases[1].find('failure').get('message'), 'status code 200 not equal 201')
+        self.assertEqual(len(cases[0].findall('properties/property')), 7)
+        self.assertIsNone(get_reporter('html'))
+
+
+class TestShards(StubServerTestCase):
+
+    def get_actions(self):
+        return Actions([
+            Action([Step('/a', name='step1'), Step('/b')], 'action1'),
+            Action([Step('/%action1.step1.id%')], 'action2'),
+            Action([Step('/c', name='step1')], 'action3'),
+            Action([Step('/d'), Step('/e'), Step('/f')], 'action4'),
+            Action([Step('/%action3.step1.id%')], 'action5'),
+            Action([Step('/g')], 'action6'),
+        ])
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('1/4'), (0, 4))
+        self.assertEqual(parse_shard('4/4'), (3, 4))
+        for text in ('0/4', '5/4', '1', 'a/b'):
+            with self.assertRaises(ValueError):
+                parse_shard(text)
+
+    def test_get_components(self):
+        self.assertEqual(sorted(get_components(self.get_actions())), [[0, 1], [2, 4], [3], [5]])
+
+    def test_get_shards(self):
+        actions = self.get_actions()
+        self.assertEqual(get_shards(actions, 1), [[0, 1, 2, 3, 4, 5]])
+        self.assertEqual(get_shards(actions, 2), [[0, 1, 2, 4], [3, 5]])
+        self.assertEqual(get_shards(actions, 3), [[0, 1], [3], [2, 4, 5]])
+        self.assertEqual(get_shards(actions, 5), [[0, 1], [3], [2, 4], [5], []])
+        shard = get_shard(actions, 0, 2)
+        self.assertEqual(
+            [action.name for action in shard.actions], ['action1', 'action2', 'action3', 'action5']
+        )
+        self.assertIs(shard.sessions, actions.sessions)
+        step = shard.actions[2].steps[0]
+        step.results = {'id': 1}
+        self.assertEqual(shard.actions[3].steps[0].url, '/1')
+        self.assertEqual(actions.actions[4].steps[0].url, '/None')
+        with self.assertRaises(ValueError):
+            get_shards(LazyActions(list, {}), 2)
+
+    def test_get_shard_scheduler(self):
+        actions = BaseLoader({'url': 'http://test.com/', 'rate': 10, 'host_concurrency': 2, 'actions': [
+            {'action1': {'steps': [{'url': 'a'}]}}, {'action2': {'rate': 5, 'steps': [{'url': 'b'}]}},
+        ]}).load()
+        for index in (0, 1):
+            shard = get_shard(actions, index, 2)
+            self.assertIs(shard.scheduler, actions.scheduler)
+        self.assertEqual(shard.actions[0].get_schedulers(), [actions.scheduler, shard.actions[0].scheduler])
+
+    def test_merge_reports(self):
+        reports = [
+            {'passed': True, 'steps': 2, 'failures': 0, 'duration': 1.5,
+             'timings': {'total': 1}, 'actions': [{'name': 'action1'}]},
+            {'passed': False, 'steps': 3, 'failures': 1, 'duration': 2.5,
+             'timings': {'total': 2, 'connect': 1}, 'actions': [{'name': 'action2'}]},
+        ]
+        report = merge_reports(reports)
+        self.assertFalse(report['passed'])
+        self.assertEqual(report['steps'], 5)
+        self.assertEqual(report['failures'], 1)
+        self.assertEqual(report['duration'], 2.5)
+        self.assertEqual(report['timings']['total'], 3)
+        self.assertEqual(report['timings']['connect'], 1)
+        self.assertEqual([a['name'] for a in report['actions']], ['action1', 'action2'])
+
+    def test_run_processes(self):
+        fd, filename = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as fn:
+            fn.write(yaml.dump({
+                'url': self.url,
+                'actions': [
+                    {'action1': {'steps': [{'step1': {'url': 'a', 'result': {'rc': True, 'path': '/a'}}}]}},
+                    {'action2': {'steps': [{'url': '%action1.step1.path%/b', 'code': 201}]}},
+                    {'action3': {'steps': [{'url': 'c'}, {'url': 'd'}]}},
+                ],
+            }))
+        self.addCleanup(os.remove, filename)
+        # steps are logged by worker processes
+        report = run_processes(YAMLLoader, filename, processes=2)
+        self.assertFalse(report['passed'])
+        self.assertEqual(report['steps'], 4)
+        self.assertEqual(report['failures'], 1)
+        self.assertEqual(
+            sorted(action['name'] for action in report['actions']),
+            ['action1', 'action2', 'action3']
+        )
+        self.assertEqual(
+            [r['url'] for a in report['actions'] if a['name'] == 'action2' for r in a['records']],
+            [self.url + '/a/b']
+        )
+
+
+class TestCassettes(StubServerTestCase):
+
+    def get_actions(self):
+        return Actions([
+            Action([
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}, name='step1'),
+                Step(self.url + '%action1.step1.path%/b', method='post', data={'x': '1'},
+                     expected_data={'path': '/b'}, stream=True),
+            ], 'action1'),
+        ])
+
+    def test_record_replay(self):
+        fn = io.StringIO()
+        actions = self.get_actions()
+        actions.sessions = Recorder(actions.sessions, fn)
+        with self.assertLogs('actions') as recorded:
+            actions.run()
+        lines = list(map(json.loads, fn.getvalue().splitlines()))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1]['method'], 'POST')
+        self.assertEqual(lines[1]['url'], self.url + '/a/b')
+        self.assertEqual(lines[1]['body'], '{"data": {"x": "1"}}')
+        self.assertEqual(lines[1]['status_code'], 200)
+        self.assertEqual(json.loads(lines[1]['content']), {'rc': True, 'path': '/a/b'})
+        actions = self.get_actions()
+        actions.sessions = Player(io.StringIO(fn.getvalue()))
+        with patch('sessions.Sessions.request') as request:
+            with self.assertLogs('actions') as replayed:
+                actions.run()
+            self.assertFalse(request.called)
+        self.assertEqual(replayed.output, recorded.output)
+        self.assertEqual(get_report(actions)['failures'], 1)
+
+    def test_Player(self):
+        lines = [
+            {'method': 'GET', 'url': 'http://test.com/', 'body': '', 'status_code': 200,
+             'headers': {}, 'content': '1'},
+            {'method': 'GET', 'url': 'http://test.com/', 'body': '', 'status_code': 201,
+             'headers': {}, 'content': 'AAE=', 'encoding': 'base64'},
+        ]
+        player = Player(io.StringIO('\n'.join(map(json.dumps, lines)) + '\n\n'))
+        resp = player.request('get', 'http://test.com/')
+        self.assertEqual((resp.status_code, resp.content), (200, b'1'))
+        self.assertEqual(resp.raw.read(10, decode_content=True), b'1')
+        for _ in range(2):
+            resp = player.request('get', 'http://test.com/')
+            self.assertEqual((resp.status_code, resp.content), (201, b'\x00\x01'))
+        with self.assertRaises(requests.ConnectionError):
+            player.request('get', 'http://test.com/', data={'x': 1})
+        self.assertEqual(encode_content(b'\x00\xff'), {'content': 'AP8=', 'encoding': 'base64'})
+
+    def test_Player_miss(self):
+        line = {'method': 'GET', 'url': 'http://test.com/a', 'body': '', 'status_code': 200,
+                'headers': {}, 'content': '1'}
+        actions = Actions([Action([Step('http://test.com/b'), Step('http://test.com/a')], 'action1')])
+        actions.sessions = Player(io.StringIO(json.dumps(line) + '\n'))
+        with self.assertLogs('actions'):
+            actions.run()
+        first, second = actions.actions[0].records
+        self.assertEqual(first['errors'][0], 'request failed: no recorded response for GET http://test.com/b')
+        self.assertTrue(second['passed'])
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_StubServer(self):
+        with StubServer(size=1000) as server:
+            resp = requests.get(server.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreaterEqual(len(resp.content), 1000)
+        self.assertLess(len(resp.content), 1100)
+        self.assertTrue(resp.json()['rc'])
+
+    def test_bench_steps(self):
+        with StubServer() as server:
+            results = bench_steps(server.url, json.loads(server.content.decode()), 5)
+        self.assertGreater(results['step.wall']['value'], results['step.overhead']['value'])
+
+    def test_compare_results(self):
+        baseline = {
+            'a': {'value': 10, 'unit': 'us', 'better': 'lower'},
+            'b': {'value': 100, 'unit': 'items/s', 'better': 'higher'},
+            'c': {'value': 0, 'unit': 'us', 'better': 'lower'},
+        }
+        results = {
+            'a': {'value': 12.5, 'unit': 'us', 'better': 'lower'},
+            'b': {'value': 90, 'unit': 'items/s', 'better': 'higher'},
+            'c': {'value': 1, 'unit': 'us', 'better': 'lower'},
+            'd': {'value': 1, 'unit': 'us', 'better': 'lower'},
+        }
+        self.assertEqual(compare_results(baseline, results), [
+            ('a', 10, 12.5, 0.25, True),
+            ('b', 100, 90, 0.1, False),
+        ])
+
+
+class CachingHandler(StubHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        time.sleep(self.latency)
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content = json.dumps({'rc': True, 'path': self.path}).encode()
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TestResponseCache(StubServerTestCase):
+    handler = CachingHandler
+
+    def setUp(self):
+        CachingHandler.requests = []
+
+    def tearDown(self):
+        CachingHandler.latency = 0
+
+    def test_run(self):
+        actions = Actions([
+            Action([
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}, cache=True),
+                Step(self.url + 'a', expected_data={'rc': False}, cache=True),
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}, cache=True, stream=True),
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}),
+            ], 'action1'),
+        ])
+        with self.assertLogs('actions'):
+            actions.run()
+        self.assertEqual([record['passed'] for record in actions.actions[0].records], [True, False, True, True])
+        self.assertEqual(CachingHandler.requests, [('/a', None), ('/a', None)])
+        cache = actions.sessions.cache
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_revalidate(self):
+        sessions = Sessions(cache=ResponseCache(ttl=0))
+        for _ in range(2):
+            resp = sessions.request('get', self.url + 'a', cache=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(json.loads(resp.content.decode()), {'rc': True, 'path': '/a'})
+        self.assertEqual(CachingHandler.requests, [('/a', None), ('/a', '"v1"')])
+        self.assertEqual(sessions.cache.revalidated, 1)
+
+    def test_lru(self):
+        sessions = Sessions(cache=ResponseCache(size=2))
+        for path in ('a', 'b', 'a', 'c', 'a', 'b'):
+            sessions.request('get', self.url + path, cache=True)
+        self.assertEqual([path for path, _ in CachingHandler.requests], ['/a', '/b', '/c', '/b'])
+        self.assertEqual(list(sessions.cache.entries), [self.url + 'a', self.url + 'b'])
+        sessions.request('post', self.url + 'a', cache=True)
+        self.assertEqual(len(CachingHandler.requests), 5)
+
+    def test_collapse(self):
+        CachingHandler.latency = 0.2
+        sessions = Sessions(cache=ResponseCache())
+        results = []
+        threads = [
+            Thread(target=lambda: results.append(sessions.request('get', self.url + 'a', cache=True)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(CachingHandler.requests), 1)
+        self.assertEqual(sessions.cache.collapsed, 4)
+        self.assertEqual(set(resp.content for resp in results), {b'{"rc": true, "path": "/a"}'})
+
+    def test_pickle(self):
+        cache = pickle.loads(pickle.dumps(ResponseCache(ttl=5, size=10)))
+        self.assertEqual((cache.ttl, cache.size, len(cache.entries)), (5, 10, 0))
+        data = {'cache_ttl': '5', 'cache_size': 10, 'actions': []}
+        cache = BaseLoader(data).get_sessions().cache
+        self.assertEqual((cache.ttl, cache.size), (5.0, 10))
+
+
+class TestScheduler(StubServerTestCase):
+
+    def test_RateProfile(self):
+        profile = RateProfile(10)
+        self.assertAlmostEqual(profile.get_offset(0), 0)
+        self.assertAlmostEqual(profile.get_offset(5), 0.5)
+        profile = RateProfile(0, 10, 2)
+        self.assertAlmostEqual(profile.get_offset(2.5), 1)
+        self.assertAlmostEqual(profile.get_offset(10), 2)
+        self.assertAlmostEqual(profile.get_offset(20), 3)
+        profile = RateProfile(10, 5, 2)
+        self.assertAlmostEqual(profile.get_offset(15), 2)
+        self.assertAlmostEqual(profile.get_offset(20), 3)
+
+    def test_TokenBucket(self):
+        bucket = TokenBucket(20, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_host_concurrency(self):
+        scheduler = Scheduler(host_concurrency=2)
+        running, peaks, lock = [0], [], Lock()
+
+        def run(url):
+            with scheduler.dispatch(url):
+                with lock:
+                    running[0] += 1
+                    peaks.append(running[0])
+                time.sleep(0.05)
+                with lock:
+                    running[0] -= 1
+
+        threads = [Thread(target=run, args=('http://a.com/{}'.format(i),)) for i in range(5)]
+        threads.append(Thread(target=run, args=('http://b.com/',)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(peaks), 3)
+        self.assertEqual(set(scheduler.semaphores), {'a.com', 'b.com'})
+
+    def test_run(self):
+        actions = Actions([
+            Action([Step(self.url, expected_data={'rc': True, 'path': '/'}) for _ in range(3)], 'action1'),
+            Action([Step(self.url, expected_data={'rc': True, 'path': '/'}) for _ in range(3)], 'action2'),
+        ], scheduler=Scheduler(rate=RateProfile(20)))
+        with self.assertLogs('actions'):
+            actions.run(workers=2)
+        self.assertGreaterEqual(actions.duration, 0.24)
+        report = get_report(actions)
+        self.assertEqual(report['lag']['steps'], 6)
+        self.assertEqual(report['lag']['late'], 0)
+        self.assertNotIn('lag', report['actions'][0])
+        self.assertEqual(merge_reports([report, report])['lag']['steps'], 12)
+
+    def test_lag(self):
+        StubHandler.latency = 0.05
+        action = Action([Step(self.url, expected_data={'rc': True, 'path': '/'}) for _ in range(3)], 'action1')
+        action.scheduler = Scheduler(rate=RateProfile(1000))
+        actions = Actions([action])
+        with self.assertLogs('actions') as logs:
+            actions.run()
+        self.assertIn('action1 can not keep up with target rate: 2 of 3 steps late', logs.output[-1])
+        report = get_report(actions)
+        self.assertEqual(report['actions'][0]['lag']['late'], 2)
+        self.assertGreater(report['actions'][0]['lag']['max_lag'], 0.05)
+        merged = merge_reports([report, report])
+        self.assertEqual(merged['actions'][1]['lag']['late'], 2)
+        self.assertNotIn('lag', merged)
+
+    def test_get_scheduler(self):
+        loader = BaseLoader({})
+        self.assertIsNone(loader.get_scheduler({'url': 'http://test.com'}))
+        scheduler = loader.get_scheduler({'rate': 5, 'host_rate': '2', 'host_concurrency': 4})
+        self.assertEqual(scheduler.rate.get_offset(10), 2)
+        self.assertEqual((scheduler.host_rate, scheduler.host_burst, scheduler.host_concurrency), (2.0, 1, 4))
+        scheduler = loader.get_scheduler({'rate': {'from': 1, 'to': 10, 'duration': '1m'}})
+        self.assertEqual((scheduler.rate.start, scheduler.rate.end, scheduler.rate.duration), (1, 10, 60))
+        with self.assertRaises(ValueError):
+            loader.get_scheduler({'rate': 0})
+        data = {
+            'url': 'http://test.com/', 'rate': 10,
+            'actions': [{'action1': {'host_concurrency': 1, 'steps': [{'url': 'a'}]}}],
+        }
+        actions = BaseLoader(data).load()
+        self.assertEqual(actions.actions[0].steps[0].get_schedulers(), [actions.scheduler, actions.actions[0].scheduler])
+        actions = pickle.loads(pickle.dumps(actions))
+        self.assertEqual(actions.scheduler.rate.start, 10)
+        self.assertEqual(actions.copy().actions[0].scheduler.host_concurrency, 1)
+        with self.assertRaises(ValueError):
+            AsyncRunner(actions)
+
+
+class TestHistory(StubServerTestCase):
+
+    def get_actions(self, fail=False, skip_errors=False):
+        return Actions([
+            Action([Step(self.url, expected_code=500 if fail else 200, skip_errors=skip_errors)], 'action1'),
+            Action([Step(self.url) for _ in range(3)], 'action2'),
+            Action([Step(self.url + '%action1._.rc%')], 'action3'),
+        ])
+
+    def test_get_ranks(self):
+        actions = self.get_actions()
+        dependencies = actions.get_dependencies()
+        self.assertEqual(actions.get_ranks(dependencies), {0: 2, 1: 3, 2: 1})
+        self.assertEqual(actions.get_ranks(dependencies, {0: 2, 1: 1}), {0: 2.75, 1: 1, 2: 0.75})
+
+    def test_order(self):
+        actions = Actions([Action([Step(self.url)], 'action{}'.format(i)) for i in range(4)])
+        order = []
+        with patch.object(Action, 'run', autospec=True, side_effect=lambda action: order.append(action.name)):
+            actions.run(workers=2, durations={0: 1, 1: 2, 2: 1, 3: 5})
+        self.assertEqual(order[:2], ['action3', 'action1'])
+        self.assertEqual(sorted(order[2:]), ['action0', 'action2'])
+
+    def test_fail_fast(self):
+        actions = self.get_actions(fail=True)
+        with self.assertLogs('actions') as logs:
+            actions.run(fail_fast=True)
+        self.assertIn('run is cancelled after the first failure', logs.output[-1])
+        self.assertEqual([len(action.records) for action in actions.actions], [1, 0, 0])
+        report = get_report(actions)
+        self.assertTrue(report['cancelled'])
+        self.assertTrue(merge_reports([report])['cancelled'])
+        actions = self.get_actions(fail=True, skip_errors=True)
+        with self.assertLogs('actions'):
+            actions.run(fail_fast=True)
+        self.assertEqual([len(action.records) for action in actions.actions], [1, 3, 1])
+        self.assertNotIn('cancelled', get_report(actions))
+
+    def test_fail_fast_parallel(self):
+        StubHandler.latency = 0.05
+        actions = self.get_actions(fail=True)
+        with self.assertLogs('actions'):
+            actions.run(workers=2, durations={0: 1, 1: 0.1}, fail_fast=True)
+        self.assertEqual(len(actions.actions[0].records), 1)
+        self.assertLess(len(actions.actions[1].records), 3)
+        self.assertEqual(len(actions.actions[2].records), 0)
+
+    def test_History(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'history', 'history.json')
+        history = History(filename)
+        actions = self.get_actions()
+        self.assertEqual(history.get_durations('test.yaml', actions), {})
+        for action, duration in zip(actions.actions, (1, 2, 3)):
+            action.records, action.duration = [{}] * len(action.steps), duration
+        actions.actions[2].records = []
+        history.update('test.yaml', actions)
+        history.save()
+        history = History(filename)
+        self.assertEqual(history.get_durations('test.yaml', actions), {0: 1, 1: 2})
+        self.assertEqual(history.get_durations('other.yaml', actions), {})
+        actions.actions[0].duration = 3
+        history.update('./test.yaml', actions)
+        self.assertEqual(history.get_durations('test.yaml', actions), {0: 2, 1: 2})
+
+
+class TestRunState(StubServerTestCase):
+
+    def get_actions(self):
+        return Actions([
+            Action([
+                Step(self.url + 'a', expected_data={'rc': True, 'path': '/a'}, name='step1'),
+                Step(self.url + 'b', expected_code=500, name='step2'),
+            ], 'action1'),
+            Action([
+                Step(self.url + '%action1.step1.path%', expected_data={'rc': True, 'path': '/x'}, name='step1'),
+                Step(self.url + 'c', name='step2'),
+            ], 'action2'),
+            Action([Step(self.url + '%action2.step1.rc%/%action2.step2.rc%')], 'action3'),
+        ])
+
+    def test_get_closure(self):
+        actions = self.get_actions()
+        self.assertEqual(get_closure(actions, {(1, 0)}), {(0, 0), (1, 0)})
+        self.assertEqual(get_closure(actions, {(2, 0)}), {(0, 0), (1, 0), (1, 1), (2, 0)})
+        self.assertEqual(get_action_steps(actions, ['action1', 'action3']), {(0, 0), (0, 1), (2, 0)})
+        with self.assertRaises(ValueError):
+            get_action_steps(actions, ['action4'])
+
+    def test_select_steps(self):
+        actions = select_steps(self.get_actions(), {(0, 0), (1, 0)})
+        self.assertEqual([action.name for action in actions.actions], ['action1', 'action2'])
+        self.assertEqual([len(action.steps) for action in actions.actions], [1, 1])
+        self.assertEqual(actions.actions[1].steps[0].url, self.url + 'None')
+        with self.assertLogs('actions'):
+            actions.run()
+        self.assertEqual(actions.actions[1].steps[0].last_url, self.url + '/a')
+
+    def test_rerun_failed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = get_state_filename('test.yaml', directory)
+        self.assertEqual(os.path.dirname(filename), directory)
+        state = RunState(filename, 'key1')
+        self.assertFalse(state.matches)
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            actions.run()
+        state.update(actions)
+        state.save()
+        state = RunState(filename, 'key1')
+        self.assertTrue(state.matches)
+        self.assertEqual(state.steps[(0, 0)]['results'], {'path': '/a'})
+        actions = self.get_actions()
+        keys = get_closure(actions, state.get_failed(actions))
+        self.assertEqual(keys, {(0, 0), (0, 1), (1, 0)})
+        actions = select_steps(actions, keys)
+        with self.assertLogs('actions'):
+            actions.run()
+        state.update(actions, keys)
+        self.assertEqual(state.steps[(1, 0)]['results'], {})
+        self.assertEqual(state.get_failed(self.get_actions()), {(0, 1), (1, 0)})
+        state.save()
+        self.assertFalse(RunState(filename, 'key2').matches)
+        self.assertEqual(RunState(filename, 'key2').steps, {})
+
+
+class FlakyHandler(StubHandler):
+    failures = 0
+    count = 0
+
+    def do_GET(self):
+        FlakyHandler.count += 1
+        if FlakyHandler.failures > 0:
+            FlakyHandler.failures -= 1
+            time.sleep(self.latency)
+            self.send_response(502)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super(FlakyHandler, self).do_GET()
+
+
+class TestRetries(StubServerTestCase):
+    handler = FlakyHandler
+
+    def setUp(self):
+        FlakyHandler.failures = 0
+        FlakyHandler.count = 0
+
+    def tearDown(self):
+        FlakyHandler.latency = 0
+
+    def test_retries(self):
+        FlakyHandler.failures = 2
+        step = Step(self.url, expected_data={'rc': True, 'path': '/'}, retries=2, backoff=0.02)
+        with self.assertLogs('actions') as logs:
+            self.assertTrue(step.run())
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(FlakyHandler.count, 3)
+        self.assertEqual(step.get_record()['retries'], 2)
+        self.assertLess(step.timings['retry'], 0.06 + 0.05)
+        self.assertGreater(step.timings['total'], step.timings['retry'])
+        FlakyHandler.failures = 3
+        step = Step(self.url, retries=1)
+        with self.assertLogs('actions'):
+            self.assertFalse(step.run())
+        self.assertEqual((step.status_code, step.retried), (502, 1))
+        FlakyHandler.failures = 3
+        step = Step(self.url, expected_code=502, retries=1)
+        with self.assertLogs('actions'):
+            self.assertTrue(step.run())
+        self.assertEqual(step.retried, 0)
+
+    def test_get_retry_delay(self):
+        step = Step(self.url, retries=3, backoff=0.5)
+        for retried in range(3):
+            step.retried = retried
+            delays = [step.get_retry_delay(502) for _ in range(100)]
+            self.assertTrue(all(0 <= delay <= 0.5 * 2 ** retried for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+        step.retried = 3
+        self.assertIsNone(step.get_retry_delay(502))
+        step.retried = 0
+        self.assertIsNone(step.get_retry_delay(200))
+        action = Action([step], 'action1')
+        action.deadline = 0.3
+        action.start()
+        # retry which would end after deadline is not made
+        with patch('actions.random.uniform', side_effect=lambda low, high: high):
+            self.assertIsNone(step.get_retry_delay(502))
+        with patch('actions.random.uniform', side_effect=lambda low, high: low):
+            self.assertEqual(step.get_retry_delay(502), 0)
+
+    def test_timeout(self):
+        FlakyHandler.latency = 0.3
+        step = Step(self.url, timeout=0.05, retries=1)
+        with self.assertLogs('actions') as logs:
+            self.assertFalse(step.run())
+        self.assertEqual(FlakyHandler.count, 2)
+        self.assertIn('request failed', step.errors[0])
+        self.assertIn('status code None not equal 200', logs.output[1])
+        self.assertLess(step.timings['total'], 0.25)
+
+    def test_deadline(self):
+        FlakyHandler.latency = 0.06
+        action = Action([Step(self.url), Step(self.url), Step(self.url)], 'action1')
+        action.deadline = 0.1
+        actions = Actions([action])
+        with self.assertLogs('actions'):
+            actions.run()
+        self.assertEqual([record['passed'] for record in action.records], [True, False, False])
+        self.assertIn('request failed', action.records[1]['errors'][0])
+        self.assertEqual(action.records[2]['errors'][0], 'deadline of action is exceeded')
+        self.assertEqual(FlakyHandler.count, 2)
+        self.assertLess(action.duration, 0.2)
+        self.assertEqual(actions.copy().actions[0].deadline, 0.1)
+
+    def test_report(self):
+        FlakyHandler.failures = 1
+        actions = Actions([Action([Step(self.url, retries=1), Step(self.url)], 'action1')])
+        with self.assertLogs('actions'):
+            actions.run()
+        report = get_report(actions)
+        self.assertEqual((report['retries'], report['actions'][0]['retries']), (1, 1))
+        self.assertGreater(report['timings']['retry'], 0)
+        self.assertEqual(merge_reports([report, report])['retries'], 2)
+
+    def test_async(self):
+        FlakyHandler.failures = 1
+        actions = Actions([Action([Step(self.url, retries=1)], 'action1')])
+        with self.assertLogs('actions'):
+            AsyncRunner(actions).run()
+        self.assertEqual(actions.actions[0].records[0]['retries'], 1)
+        self.assertTrue(actions.actions[0].records[0]['passed'])
+        FlakyHandler.latency = 0.3
+        actions = Actions([Action([Step(self.url, timeout=0.05)], 'action1')])
+        with self.assertLogs('actions'):
+            AsyncRunner(actions).run()
+        self.assertIn('request failed', actions.actions[0].records[0]['errors'][0])
+
+    def test_loader(self):
+        data = {
+            'url': 'http://test.com/', 'timeout': '5s', 'retries': 2,
+            'actions': [{'action1': {'deadline': '1m', 'backoff': 0.5, 'steps': [{'url': 'a'}, {'url': 'b', 'retries': '0'}]}}],
+        }
+        action = BaseLoader(data).load().actions[0]
+        self.assertEqual(action.deadline, 60)
+        self.assertEqual([(step.timeout, step.retries, step.backoff) for step in action.steps], [(5, 2, 0.5), (5, 0, 0.5)])
+
+
+class EchoHandler(StubHandler):
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    return body
+                body += chunk
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self):
+        body = self.read_body()
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        content = json.dumps({
+            'method': self.command,
+            'type': self.headers.get('Content-Type'),
+            'encoding': self.headers.get('Content-Encoding'),
+            'length': self.headers.get('Content-Length'),
+            'body': body.decode(),
+        }).encode()
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
+
+
+class TestBodies(StubServerTestCase):
+    handler = EchoHandler
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, 'upload.txt')
+        with open(self.filename, 'w') as fn:
+            fn.write('x' * 100000)
+
+    def run_step(self, **kwargs):
+        first = Step(self.url, expected_data={'method': 'GET', 'type': None, 'encoding': None, 'length': None, 'body': ''}, name='step1')
+        step = Step(self.url, **kwargs)
+        Actions([Action([first, step], 'action1')])
+        with self.assertLogs('actions'):
+            self.assertTrue(first.run())
+            step.run()
+        return step
+
+    def test_json(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            step = self.run_step(method=method, json={'a': ['%action1.step1.method%', '%action1.step1.type%'], 'b': 'x %action1.step1.method%'}, expected_data={
+                'method': method.upper(), 'type': 'application/json', 'encoding': None, 'length': '34',
+                'body': '{"a": ["GET", null], "b": "x GET"}',
+            })
+            self.assertEqual(step.errors, [])
+        self.assertEqual(step.get_references(), ['action1.step1.method', 'action1.step1.type', 'action1.step1.method'])
+
+    def test_file(self):
+        for use_mmap in (False, True):
+            step = self.run_step(method='put', file=self.filename, mmap=use_mmap, expected_data={
+                'method': 'PUT', 'type': 'application/octet-stream', 'encoding': None, 'length': '100000',
+                'body': 'x' * 100000,
+            })
+            self.assertEqual(step.errors, [])
+        self.assertEqual(list(FileBody(self.filename, True)), [b'x' * 65536, b'x' * 34464])
+
+    def test_gzip(self):
+        step = self.run_step(method='post', file=self.filename, gzip=True, comparator=comparators.DictComparator(only_keys=True), expected_data={
+            'method': None, 'type': None, 'encoding': None, 'length': None, 'body': None,
+        })
+        self.assertEqual(step.errors, [])
+        for kwargs in ({'data': {'a': 'b c'}}, {'json': {'a': 1}}):
+            step = self.run_step(method='patch', gzip=True, **kwargs)
+            self.assertEqual(step.status_code, 200)
+        kwargs = step.get_kwargs()
+        self.assertEqual(gzip.decompress(kwargs['data']), b'{"a": 1}')
+        self.assertEqual(kwargs['data'], step.get_kwargs()['data'])
+        self.assertEqual(kwargs['headers'], {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        self.assertEqual(gzip.decompress(b''.join(GzipBody([b'a', b'', b'b']))), b'ab')
+
+    def test_multipart(self):
+        step = Step(self.url, method='post', data={'name': 'value'}, files={'upload': self.filename})
+        body = step.get_kwargs()['data']
+        content = b''.join(body)
+        self.assertEqual(len(content), len(body))
+        self.assertIn(b'Content-Disposition: form-data; name="name"\r\n\r\nvalue\r\n', content)
+        self.assertIn(b'name="upload"; filename="upload.txt"', content)
+        self.assertTrue(content.endswith('--{}--\r\n'.format(body.boundary).encode()))
+        self.assertEqual(str(body), 'multipart:{"fields": {"name": "value"}, "files": {"upload": "%s"}}' % self.filename)
+        actions = Actions([Action([step], 'action1')])
+        with self.assertLogs('actions'):
+            AsyncRunner(actions).run()
+        self.assertTrue(actions.actions[0].records[0]['passed'])
+        step.expected_data = {}
+        step.comparator = comparators.DictComparator(only_keys=True)
+        with self.assertLogs('actions'):
+            step.run()
+        self.assertEqual(step.errors[0][:38], 'response data does not match: $.method')
+
+    def test_loader(self):
+        data = {
+            'url': 'http://test.com/', 'gzip': True,
+            'actions': [{'action1': {'steps': [{'url': 'a', 'method': 'put', 'file': 'upload.bin', 'mmap': True, 'files': {'f': '/tmp/f'}}]}}],
+        }
+        loader = BaseLoader(data)
+        loader.filename = '/suites/test.yaml'
+        step = loader.load().actions[0].steps[0]
+        self.assertEqual((step.file, step.files, step.mmap, step.gzip), ('/suites/upload.bin', {'f': '/tmp/f'}, True, True))
+
+
+class TestDatasets(StubServerTestCase):
+    handler = EchoHandler
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.csv = os.path.join(self.directory, 'rows.csv')
+        with open(self.csv, 'w') as fn:
+            fn.write('id,name\n1,a\n2,b b\n3,c\n')
+        self.jsonl = os.path.join(self.directory, 'rows.jsonl')
+        with open(self.jsonl, 'w') as fn:
+            fn.write('{"id": 1, "tags": ["x"]}\n\n{"id": 2, "tags": []}\n')
+
+    def test_read_batches(self):
+        self.assertEqual(list(read_batches(self.csv, 2)), [
+            [{'id': '1', 'name': 'a'}, {'id': '2', 'name': 'b b'}], [{'id': '3', 'name': 'c'}],
+        ])
+        self.assertEqual(list(read_batches(self.jsonl)), [[{'id': 1, 'tags': ['x']}, {'id': 2, 'tags': []}]])
+        with self.assertRaises(ValueError):
+            list(read_batches(os.path.join(self.directory, 'rows.txt')))
+
+    def test_run(self):
+        step = Step(self.url + 'items/%id%', method='post', data={'name': '%name%'}, dataset=self.csv, name='step1', expected_data={
+            'method': 'POST', 'type': 'application/x-www-form-urlencoded', 'encoding': None, 'length': None, 'body': None,
+        }, comparator=comparators.DictComparator(only_keys=True))
+        actions = Actions([Action([step, Step(self.url + '%action1.step1.method%')], 'action1')])
+        with self.assertLogs('actions') as logs:
+            actions.run()
+        self.assertEqual([line.split()[-1] for line in logs.output], [
+            self.url + 'items/1', self.url + 'items/2', self.url + 'items/3', self.url + 'POST',
+        ])
+        # passed rows are only counted
+        records = actions.actions[0].records
+        self.assertEqual(len(records), 4)
+        self.assertEqual([record['url'] for record in records], [self.url + 'POST'])
+        self.assertIsNone(step.row)
+        report = get_report(actions)
+        self.assertEqual((report['steps'], report['failures']), (4, 0))
+        self.assertGreater(report['timings']['total'], records[0]['timings']['total'])
+
+    def test_json(self):
+        step = Step(self.url, method='post', json={'id': '%id%', 'tags': '%tags%'}, dataset=self.jsonl, expected_data={
+            'method': 'POST', 'type': 'application/json', 'encoding': None, 'length': '24',
+            'body': '{"id": 1, "tags": ["x"]}',
+        })
+        actions = Actions([Action([step], 'action1')])
+        with self.assertLogs('actions'):
+            actions.run()
+        records = actions.actions[0].records
+        self.assertEqual(len(records), 2)
+        self.assertEqual([(record['row'], record['passed']) for record in records], [(1, False)])
+        self.assertEqual(get_report(actions)['actions'][0]['failures'], 1)
+
+    def test_loader(self):
+        filename = os.path.join(self.directory, 'suite.yml')
+        with open(filename, 'w') as fn:
+            yaml.dump({'url': self.url, 'actions': [{'action1': {'steps': [
+                {'step1': {'url': 'items/%id%', 'dataset': 'rows.csv'}},
+            ]}}]}, fn)
+        actions = YAMLLoader(filename).load()
+        self.assertEqual(actions.actions[0].steps[0].dataset, self.csv)
+        with self.assertLogs('actions'):
+            actions.run()
+        self.assertEqual(len(actions.actions[0].records), 3)
+
+
+class TestTraces(StubServerTestCase):
+
+    def setUp(self):
+        self.tracer = start_tracing()
+        self.addCleanup(stop_tracing)
+
+    def get_spans(self, category=None):
+        return [
+            event for event in self.tracer.get_events()
+            if event['ph'] == 'X' and category in (None, event['cat'])
+        ]
+
+    def test_steps(self):
+        step = Step(self.url, expected_data={'result': 'ok'}, name='step1')
+        actions = Actions([Action([step, Step(self.url + '%action1.step1.result%')], 'action1')])
+        with self.assertLogs('actions'):
+            actions.run(workers=2)
+        self.assertEqual([span['name'] for span in self.get_spans('action')], ['action1'])
+        self.assertEqual([span['name'] for span in self.get_spans('step')], ['action1.step1', 'action1._'])
+        names = [span['name'] for span in self.get_spans()]
+        for name in ('resolve', 'network', 'decode', 'compare'):
+            self.assertIn(name, names)
+        self.assertEqual(names.count('decode'), 1)
+        action = self.get_spans('action')[0]
+        for span in self.get_spans():
+            # every span is inside span of action on the same track
+            self.assertEqual(span['tid'], action['tid'])
+            self.assertGreaterEqual(span['ts'], action['ts'])
+            self.assertLessEqual(span['ts'] + span['dur'], action['ts'] + action['dur'] + 1)
+        metadata = [event for event in self.tracer.get_events() if event['ph'] == 'M']
+        self.assertIn(action['tid'], [event.get('tid') for event in metadata])
+        fn = io.StringIO()
+        self.tracer.write(fn)
+        self.assertEqual(json.loads(fn.getvalue())['traceEvents'], self.tracer.get_events())
+
+    def test_async(self):
+        actions = Actions([
+            Action([Step(self.url, name='step1')], 'action1'),
+            Action([Step(self.url, name='step1')], 'action2'),
+        ])
+        with self.assertLogs('actions'):
+            AsyncRunner(actions, workers=2).run()
+        spans = self.get_spans('action')
+        self.assertEqual(sorted(span['name'] for span in spans), ['action1', 'action2'])
+        self.assertNotEqual(spans[0]['tid'], spans[1]['tid'])
+        self.assertEqual(len(self.get_spans('network')), 2)
+        self.assertEqual(len(self.get_spans('schedule')), 2)
+
+    def test_loader(self):
+        loader = BaseLoader({'url': self.url, 'actions': [{'action1': {'steps': [{'url': 'a'}]}}]})
+        loader.load()
+        self.assertEqual([span['name'] for span in self.get_spans('loader')], ['parse', 'build', 'load'])
+
+    def test_disabled(self):
+        stop_tracing()
+        self.assertIsInstance(get_tracer(), NullTracer)
+        with self.assertLogs('actions'):
+            Step(self.url).run()
+        self.assertEqual(self.get_spans(), [])
+
+
+class TestDecoding(StubServerTestCase):
+
+    def get_actions(self):
+        return Actions([Action([
+            Step(self.url, name='step1'),
+            Step(self.url, name='step2'),
+            Step(self.url + '%action1.step1.rc%'),
+        ], 'action1')])
+
+    def test_demand(self):
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            actions.run()
+        step1, step2, step3 = actions.actions[0].steps
+        self.assertEqual(step1.results, {'rc': True})
+        self.assertIn('decode', step1.timings)
+        self.assertEqual(step2.results, {})
+        self.assertNotIn('decode', step2.timings)
+        self.assertEqual(step3.last_url, self.url + 'True')
+
+    def test_async(self):
+        actions = self.get_actions()
+        with self.assertLogs('actions'):
+            AsyncRunner(actions).run()
+        step1, step2, step3 = actions.actions[0].steps
+        self.assertNotIn('decode', step2.timings)
+        self.assertEqual(step3.last_url, self.url + 'True')
+
+    def test_decoders(self):
+        self.addCleanup(set_decoder, 'json')
+        self.assertIs(get_decoder(), DECODERS['json'])
+        self.assertEqual(Step(self.url).decode(b'[123456789012345678901234567890]'), [123456789012345678901234567890])
+        step = Step(self.url)
+        for name in sorted(DECODERS):
+            self.assertIs(set_decoder(name), get_decoder())
+            self.assertEqual(step.decode(b'{"a": [1, 2.5, null, "\\u00e9"]}'), {'a': [1, 2.5, None, '\xe9']})
+            self.assertEqual(step.decode(b'[NaN, -Infinity]')[1], float('-inf'))
+            self.assertEqual(step.decode(b'[1e400]'), [float('inf')])
+            self.assertIsNone(step.decode(b'<html>'))
+            self.assertIsNone(step.decode(b'\xff'))
+        with self.assertRaises(ValueError):
+            set_decoder('unknown')
+        self.assertIs(get_decoder(), DECODERS[name])
+        self.assertEqual(decode_json(b'{}'), {})
+        if orjson:
+            # invalid bodies are not parsed again by json
+            with patch('decoders.json.loads') as loads:
+                self.assertIsNone(step.decode(b'<html>'))
+            loads.assert_not_called()
+
+
+class TestDaemon(StubServerTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.socket = os.path.join(self.directory, 'daemon.sock')
+        self.server = Server(self.socket)
+        thread = Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.filename = os.path.join(self.directory, 'suite.yml')
+        self.write_suite(['a', 'b'])
+
+    def write_suite(self, urls):
+        with open(self.filename, 'w') as fn:
+            yaml.dump({'url': self.url, 'actions': [{'action1': {'steps': [
+                {'url': url} for url in urls
+            ]}}]}, fn)
+
+    def run_suite(self, **kwargs):
+        request = {'command': 'run', 'filename': self.filename}
+        request.update(kwargs)
+        return list(submit(request, self.socket))
+
+    def test_run(self):
+        with self.assertLogs('actions'):
+            messages = self.run_suite()
+        self.assertEqual(len(messages), 3)
+        self.assertIn(self.url + 'a', messages[0]['log'])
+        self.assertIn(self.url + 'b', messages[1]['log'])
+        self.assertTrue(messages[2]['report']['passed'])
+        self.assertEqual(messages[2]['report']['steps'], 2)
+        suite = list(self.server.daemon.suites.values())[0]
+        sessions = suite.sessions
+        with self.assertLogs('actions'):
+            messages = self.run_suite(quiet=True)
+        # the same suite is not parsed again and keeps its connections
+        self.assertEqual(len(messages), 1)
+        self.assertIs(suite.sessions, sessions)
+        self.assertEqual(messages[0]['report']['actions'][0]['steps'], 2)
+
+    def test_reload(self):
+        with self.assertLogs('actions'):
+            self.run_suite()
+        self.write_suite(['a', 'b', 'c'])
+        os.utime(self.filename, ns=(0, 0))
+        with self.assertLogs('actions'):
+            messages = self.run_suite(quiet=True)
+        self.assertEqual(messages[-1]['report']['steps'], 3)
+
+    def test_errors(self):
+        messages = self.run_suite(filename=os.path.join(self.directory, 'missing.yml'))
+        self.assertEqual(len(messages), 1)
+        self.assertIn('FileNotFoundError', messages[0]['error'])
+        messages = self.run_suite(format='txt')
+        self.assertEqual(messages, [{'error': 'ValueError: format is not defined'}])
+
+    def test_stop(self):
+        self.assertEqual(list(submit({'command': 'stop'}, self.socket)), [{'stopped': True}])
+        with self.assertRaises(OSError):
+            list(submit({'command': 'stop'}, os.path.join(self.directory, 'other.sock')))
+
+
+class TestLogs(unittest.TestCase):
+
+    def test_LogWriter(self):
+        stream = io.StringIO()
+        handler = BatchHandler(stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        writer = LogWriter(handler, batch_size=3)
+        logger = logging.getLogger('test-logs')
+        logger.propagate = False
+        logger.setLevel('INFO')
+        logger.addHandler(writer.queue_handler)
+        self.addCleanup(logger.removeHandler, writer.queue_handler)
+        for i in range(5):
+            logger.info('step %s %s', i, Truncated('x' * 20, 10))
+        logger.warning('failed %s', 5)
+        with patch.object(stream, 'write', wraps=stream.write) as write:
+            writer.start()
+            writer.flush()
+        self.assertEqual(write.call_count, 2)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[:2], ['INFO step 0 xxxxxxx...', 'INFO step 1 xxxxxxx...'])
+        self.assertEqual(lines[5:], ['WARNING failed 5'])
+        handler.setLevel('WARNING')
+        logger.info('passed')
+        logger.warning('failed')
+        writer.flush()
+        self.assertEqual(stream.getvalue().splitlines()[6:], ['WARNING failed'])
+        writer.stop()
+        self.assertFalse(writer.thread.is_alive())
+
+    def test_lazy(self):
+        value = Truncated({'a': 'x' * 100}, 20)
+        self.assertEqual(str(value), "{'a': 'xxxxxxxxxx...")
+        self.assertEqual(repr(value), "{'a': 'xxxxxxxxxx...")
+        record = logging.LogRecord('test', logging.INFO, '', 0, '%s', (value,), None)
+        self.assertIs(LazyQueueHandler(None).prepare(record).args[0], value)
+
+    def test_get_summary(self):
+        report = {
+            'steps': 3, 'failures': 1, 'retries': 2, 'duration': 1.5, 'cancelled': True,
+            'actions': [{'records': [
+                {'passed': True, 'skip_errors': False},
+                {'passed': False, 'skip_errors': True},
+                {'passed': False, 'skip_errors': False},
+            ]}],
+        }
+        self.assertEqual(
+            get_summary(report),
+            '3 steps, 1 failed, 1 skipped errors, 2 retries in 1.500s, cancelled after the first failure'
+        )
@@ -0,0 +1,100 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from threading import Lock, current_thread, get_ident
+import json
+import os
+import time
+
+
+# tasks of asyncio engine share one thread, so each of them sets own track
+track = ContextVar('track', default=None)
+
+
+class NullTracer(object):
+
+    def span(self, name, category, **args):
+        return nullcontext()
+
+    def set_track(self, tid, name):
+        pass
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+        self.events = []
+        self.tracks = {}
+        self.lock = Lock()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, started, time.perf_counter(), args)
+
+    def add(self, name, category, started, ended, args=None):
+        tid = self.get_track()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (started - self.started) * 1e6,
+            'dur': (ended - started) * 1e6,
+            'pid': self.pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def set_track(self, tid, name):
+        track.set(tid)
+        with self.lock:
+            self.tracks[tid] = name
+
+    def get_track(self):
+        tid = track.get()
+        if tid is not None:
+            return tid
+        tid = get_ident()
+        if tid not in self.tracks:
+            with self.lock:
+                self.tracks[tid] = current_thread().name
+        return tid
+
+    def get_events(self):
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'test-rest'},
+        }]
+        events.extend(
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in sorted(self.tracks.items())
+        )
+        events.extend(self.events)
+        return events
+
+    def write(self, fn):
+        json.dump({'traceEvents': self.get_events(), 'displayTimeUnit': 'ms'}, fn)
+
+
+tracer = NullTracer()
+
+
+def get_tracer():
+    return tracer
+
+
+def start_tracing():
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def stop_tracing():
+    global tracer
+    result, tracer = tracer, NullTracer()
+    return result